@@ -0,0 +1,213 @@
+"""
+Reproducible retrieval benchmark over the shipped Data/ corpus.
+
+For each corpus size it reports encode throughput, IVF and BM25 build times,
+p50/p95/p99 query latency for exact and IVF search, recall@k of IVF against exact
+search, end-to-end query latency for exact dense and hybrid retrieval (with the
+hybrid results' recall@k against exact dense search) and peak memory.
+Results are written as JSON so runs can be diffed when the retriever or chunking changes.
+
+Usage (from the project root):
+    python -m benchmarks.retrieval_benchmark --sizes 500 1000 2000 full
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+from interface.cli import RETRIEVAL_TOP_N, RETRIEVER_MODEL
+from bm25_index import BM25Index
+from ivf_index import IVFIndex, top_k, recall_at_k
+from retrieval import SemanticRetriever, read_jsonl_chunks
+
+CORPUS_FOLDERS = ["Data/dsm5_chunks/", "Data/dataset_chunks/"]
+OUTPUT_DIR = "output/benchmarks"
+SEED = 0
+
+# Patient-style queries, so latency and recall reflect what run_cli actually asks
+CLINICAL_QUERIES = [
+    "I can't stop checking that the stove is off and washing my hands",
+    "I keep having flashbacks and nightmares about the accident",
+    "I feel hopeless and have lost interest in everything",
+    "I get sudden panic attacks with a racing heart and shortness of breath",
+    "I can't focus at work and I'm always restless and forgetful",
+    "I've been drinking more than usual to cope with stress",
+    "Some weeks I barely sleep and feel unstoppable, then I crash",
+    "I hear voices that other people don't seem to hear",
+    "I avoid social situations because I'm afraid of being judged",
+    "I have trouble sleeping and feel on edge all the time",
+]
+
+
+def load_corpus():
+    texts = []
+    sources = []
+    for folder in CORPUS_FOLDERS:
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".jsonl"):
+                chunk_texts, lines, _ = read_jsonl_chunks(os.path.join(folder, filename))
+                texts.extend(chunk_texts)
+                sources.extend((filename, ix) for ix in lines)
+    return texts, sources
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2**20  # Windows only
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KiB elsewhere
+
+
+def percentiles(samples_s):
+    ms = np.asarray(samples_s) * 1000
+    return {f"p{p}_ms": float(np.percentile(ms, p)) for p in (50, 95, 99)} | {"mean_ms": float(ms.mean())}
+
+
+def make_queries(texts, n, rng):
+    """The fixed clinical queries plus the first sentence of random corpus chunks."""
+    queries = list(CLINICAL_QUERIES)
+    for ix in rng.choice(len(texts), size=max(0, n - len(queries)), replace=False):
+        queries.append(texts[ix].split(". ")[0][:300])
+    return queries[:n]
+
+
+def bench_size(base, texts, sources, size, queries, k, rng):
+    """`base` is an empty retriever whose loaded model is shared by every size."""
+    ids = np.sort(rng.choice(len(texts), size=size, replace=False)) if size < len(texts) else np.arange(len(texts))
+    sub_texts = [texts[i] for i in ids]
+    sub_sources = [sources[i] for i in ids]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    embeddings = base._encode(sub_texts)
+    encode_s = time.perf_counter() - start
+
+    exact = SemanticRetriever.from_texts(sub_texts, sub_sources, embeddings, model=base.model,
+                                         ann_min_chunks=len(sub_texts) + 1)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    start = time.perf_counter()
+    ivf = IVFIndex.build(matrix)
+    ivf_build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    BM25Index.build(sub_texts)
+    bm25_build_s = time.perf_counter() - start
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ---- search-only latency and recall, on pre-encoded queries ----
+    q_embs = np.asarray(base.model.encode(queries, show_progress_bar=False), dtype=np.float32)
+    exact_times = []
+    exact_ids = []
+    for q in q_embs:
+        start = time.perf_counter()
+        exact_ids.append(top_k(matrix @ q, k))
+        exact_times.append(time.perf_counter() - start)
+    ivf_times = []
+    ivf_ids = []
+    for q in q_embs:
+        start = time.perf_counter()
+        ivf_ids.append(ivf.search(matrix, q, k, nprobe=exact.nprobe)[0][0])
+        ivf_times.append(time.perf_counter() - start)
+
+    # ---- end-to-end latency, including query encoding ----
+    e2e_times = []
+    for query in queries:
+        start = time.perf_counter()
+        exact.retrieve_many([query], top_n=k, mode="dense")
+        e2e_times.append(time.perf_counter() - start)
+    hybrid_times = []
+    hybrid_ids = []
+    for query in queries:
+        start = time.perf_counter()
+        results = exact.retrieve_many([query], top_n=k, mode="hybrid")[0]
+        hybrid_times.append(time.perf_counter() - start)
+        hybrid_ids.append([r["id"] for r in results])
+
+    return {
+        "corpus_size": len(sub_texts),
+        "build": {
+            "encode_s": encode_s,
+            "chunks_per_s": len(sub_texts) / encode_s if encode_s else None,
+            "ivf_build_s": ivf_build_s,
+            "ivf_nlist": ivf.nlist,
+            "bm25_build_s": bm25_build_s,
+            "peak_traced_mb": build_peak / 2**20,
+        },
+        "exact_search": percentiles(exact_times),
+        "ivf_search": percentiles(ivf_times) | {"nprobe": exact.nprobe, f"recall_at_{k}": recall_at_k(ivf_ids, exact_ids)},
+        "end_to_end_query": percentiles(e2e_times),
+        "end_to_end_hybrid_query": percentiles(hybrid_times) | {f"recall_at_{k}": recall_at_k(hybrid_ids, exact_ids)},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SemanticRetriever on the shipped corpus.")
+    parser.add_argument("--sizes", nargs="+", default=["500", "1000", "2000", "full"],
+                        help="corpus sizes to sample; 'full' uses every chunk")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=RETRIEVAL_TOP_N)
+    parser.add_argument("--embed-model", default=RETRIEVER_MODEL)
+    parser.add_argument("--out", default=None, help="output JSON path (default: output/benchmarks/retrieval_<time>.json)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(SEED)
+    texts, sources = load_corpus()
+    queries = make_queries(texts, args.queries, rng)
+    sizes = sorted({len(texts) if s == "full" else min(int(s), len(texts)) for s in args.sizes})
+
+    # Loading the model here keeps it out of every timed build
+    base = SemanticRetriever.from_texts([], embed_model=args.embed_model, encode_processes=1)
+    results = []
+    for size in sizes:
+        print(f"Benchmarking {size} chunks...")
+        result = bench_size(base, texts, sources, size, queries, args.k, np.random.default_rng(SEED))
+        results.append(result)
+        print(f"  build {result['build']['chunks_per_s']:.0f} chunks/s, "
+              f"exact p95 {result['exact_search']['p95_ms']:.2f} ms, "
+              f"ivf p95 {result['ivf_search']['p95_ms']:.2f} ms, "
+              f"recall@{args.k} {result['ivf_search'][f'recall_at_{args.k}']:.3f}, "
+              f"hybrid end-to-end p95 {result['end_to_end_hybrid_query']['p95_ms']:.2f} ms "
+              f"(recall@{args.k} vs dense {result['end_to_end_hybrid_query'][f'recall_at_{args.k}']:.3f})")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "embed_model": args.embed_model,
+        "k": args.k,
+        "queries": len(queries),
+        "seed": SEED,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+    out_path = args.out or os.path.join(OUTPUT_DIR, f"retrieval_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Benchmark saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
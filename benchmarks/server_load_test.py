@@ -0,0 +1,204 @@
+"""
+Load test for interface/server.py: simulated patients at increasing concurrency.
+
+Each simulated patient opens a session, answers every question with options drawn
+from its own seeded generator (so prompts differ between patients but repeat across
+runs) and waits for the background impression. The in-process server never reads
+or writes the LLM response cache, so every selection and impression is a real LLM call. For each concurrency level it
+reports sessions/s and p50/p95/p99 latency of session creation, ordinary answers,
+the answer that triggers inventory selection, and whole sessions, plus the
+server's embedding batch sizes. Results are written as JSON like the retrieval benchmark.
+
+Usage (from the project root):
+    python -m benchmarks.server_load_test --concurrency 1 2 4 8 16            # in-process server
+    python -m benchmarks.server_load_test --url http://127.0.0.1:8765         # a running server
+"""
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import http.client
+from urllib.parse import urlparse
+
+from benchmarks.retrieval_benchmark import CLINICAL_QUERIES, OUTPUT_DIR, git_commit, percentiles
+
+POLL_INTERVAL = 0.2   # seconds between status checks while the impression is generated
+RETRY_DELAY = 0.5     # seconds to back off after a 503
+SESSION_TIMEOUT = 900 # give up on a session after this long
+
+
+class Patient:
+    """One simulated patient on its own keep-alive connection."""
+
+    def __init__(self, url, number, seed):
+        parsed = urlparse(url)
+        self.conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=SESSION_TIMEOUT)
+        self.number = number
+        self.rng = random.Random(seed * 100_003 + number)
+        self.latencies = {"start": [], "answer": [], "selection": []}
+        self.rejected = 0
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        while True:
+            self.conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = self.conn.getresponse()
+            data = json.loads(response.read())
+            if response.status != 503:
+                break
+            self.rejected += 1
+            time.sleep(RETRY_DELAY)
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path}: HTTP {response.status} {data.get('error')}")
+        return data
+
+    def timed(self, kind, method, path, payload=None):
+        start = time.perf_counter()
+        data = self.request(method, path, payload)
+        self.latencies[kind].append(time.perf_counter() - start)
+        return data
+
+    def run(self):
+        start = time.perf_counter()
+        data = self.timed("start", "POST", "/sessions", {
+            "first_name": "Load", "last_name": f"Test{self.number}", "dob": "01/01/1990",
+            "self_report": CLINICAL_QUERIES[self.number % len(CLINICAL_QUERIES)],
+        })
+        session_id = data["session_id"]
+        path = f"/sessions/{session_id}/answers"
+        while "question" in data:
+            q = data["question"]
+            # The last PHQ-4 answer is the one that waits for retrieval + inventory selection
+            kind = "selection" if q["inventory"].startswith("PHQ-4") and q["number"] == q["of"] else "answer"
+            data = self.timed(kind, "POST", path, {"answer": self.rng.randrange(len(q["options"]))})
+        answered = time.perf_counter() - start
+        while self.request("GET", f"/sessions/{session_id}")["status"] != "complete":
+            if time.perf_counter() - start > SESSION_TIMEOUT:
+                raise TimeoutError(f"session {session_id} did not complete")
+            time.sleep(POLL_INTERVAL)
+        self.conn.close()
+        return answered, time.perf_counter() - start
+
+
+def run_level(url, concurrency, sessions, seed):
+    """`sessions` patients, at most `concurrency` at a time."""
+    patients = [Patient(url, i, seed) for i in range(sessions)]
+    durations = []
+    errors = []
+    next_patient = iter(patients)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                patient = next(next_patient, None)
+            if patient is None:
+                return
+            try:
+                durations.append(patient.run())
+            except Exception as e:
+                errors.append(str(e))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_s = time.perf_counter() - start
+
+    result = {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": len(durations),
+        "errors": errors[:5],
+        "wall_s": wall_s,
+        "sessions_per_s": len(durations) / wall_s if wall_s else None,
+        "rejected_503": sum(p.rejected for p in patients),
+    }
+    for kind in ("start", "answer", "selection"):
+        samples = [s for p in patients for s in p.latencies[kind]]
+        if samples:
+            result[kind] = percentiles(samples)
+    if durations:
+        result["until_last_answer"] = percentiles([d[0] for d in durations])
+        result["until_complete"] = percentiles([d[1] for d in durations])
+    return result
+
+
+def server_stats(url):
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+    conn.request("GET", "/stats")
+    stats = json.loads(conn.getresponse().read())
+    conn.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the intake server with simulated patients.")
+    parser.add_argument("--url", default=None, help="server to test (default: start one in-process)")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--sessions", type=int, default=None, help="sessions per level (default: 2 x concurrency)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulated patients' answers")
+    parser.add_argument("--model", default=None, help="LLM for the in-process server")
+    parser.add_argument("--out", default=None, help="output JSON path (default: output/benchmarks/server_<time>.json)")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        from interface.server import IntakeServer, make_server
+        from llm.local_llm import MODEL_NAME
+
+        # No CSVs or store rows: load-test sessions are not patients
+        intake = IntakeServer(model=args.model or MODEL_NAME, save_csv=False, use_cache=False)
+        server = make_server(intake, port=0, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            sessions = args.sessions or 2 * concurrency
+            print(f"Concurrency {concurrency}: {sessions} sessions...")
+            before = server_stats(url)["embedding_batches"]
+            # A different seed per level keeps later levels from repeating earlier prompts
+            result = run_level(url, concurrency, sessions, args.seed + concurrency)
+            after = server_stats(url)["embedding_batches"]
+            batches = after["batches"] - before["batches"]
+            result["embedding_batches"] = batches
+            result["mean_embedding_batch"] = (after["texts"] - before["texts"]) / batches if batches else None
+            results.append(result)
+            selection = result.get("selection", {})
+            print(f"  {result['sessions_per_s'] or 0:.2f} sessions/s, "
+                  f"answer p95 {result.get('answer', {}).get('p95_ms', float('nan')):.1f} ms, "
+                  f"selection p95 {selection.get('p95_ms', float('nan')):.0f} ms, "
+                  f"{len(result['errors'])} errors")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "url": args.url or "in-process",
+        "model": args.model,
+        "seed": args.seed,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    out_path = args.out or os.path.join(OUTPUT_DIR, f"server_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Load test saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
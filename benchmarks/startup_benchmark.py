@@ -0,0 +1,100 @@
+"""
+Startup benchmark: how long until the patient sees the first prompt.
+
+Reports, over fresh interpreter processes, p50/p95/p99 of
+    interpreter_start   python -c pass (the floor)
+    import_cli          python -c "import interface.cli"
+    first_prompt        python main.py until "Please enter your first name" is printed
+and, in this process, how long the background retriever warm-up takes (index load
+plus embedding model), which has to fit inside patient intake to stay invisible.
+Results are written as JSON like the retrieval benchmark.
+
+Usage (from the project root):
+    python -m benchmarks.startup_benchmark --runs 10
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+from benchmarks.retrieval_benchmark import OUTPUT_DIR, git_commit, percentiles
+
+FIRST_PROMPT = b"Please enter your first name"
+
+
+def time_command(args, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def time_first_prompt(runs):
+    """Start main.py and stop it as soon as it asks for the patient's name."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-u", "main.py"], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        output = b""
+        try:
+            while FIRST_PROMPT not in output:
+                data = proc.stdout.read1(4096)
+                if not data:
+                    raise RuntimeError(f"main.py exited before the first prompt: {output.decode(errors='replace')}")
+                output += data
+            times.append(time.perf_counter() - start)
+        finally:
+            proc.kill()
+            proc.wait()
+    return times
+
+
+def time_warm_up():
+    from interface.cli import _warm_retriever
+
+    start = time.perf_counter()
+    _warm_retriever()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CLI time-to-first-prompt.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--skip-warm-up", action="store_true", help="don't time the retriever warm-up")
+    parser.add_argument("--out", default=None, help="output JSON path (default: output/benchmarks/startup_<time>.json)")
+    args = parser.parse_args()
+
+    results = {
+        "interpreter_start": percentiles(time_command(["-c", "pass"], args.runs)),
+        "import_cli": percentiles(time_command(["-c", "import interface.cli"], args.runs)),
+        "first_prompt": percentiles(time_first_prompt(args.runs)),
+    }
+    for name, stats in results.items():
+        print(f"{name:<18} p50 {stats['p50_ms']:7.1f} ms   p95 {stats['p95_ms']:7.1f} ms")
+    if not args.skip_warm_up:
+        results["retriever_warm_up_s"] = time_warm_up()
+        print(f"{'retriever warm-up':<18} {results['retriever_warm_up_s']:.2f} s (in the background during intake)")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "runs": args.runs,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    out_path = args.out or os.path.join(OUTPUT_DIR, f"startup_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Benchmark saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
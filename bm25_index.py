@@ -0,0 +1,95 @@
+import os
+import re
+import json
+import numpy as np
+
+# Okapi BM25 over the chunk corpus, stored as a compressed sparse (CSR) inverted index:
+# the postings of term t are doc_ids[indptr[t]:indptr[t + 1]] with precomputed
+# per-posting weights, so scoring a query is a handful of vectorized adds.
+
+K1 = 1.2
+B = 0.75
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")   # keeps "y-bocs", "don't", "ptsd"
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have i i'm in is it it's its me my "
+    "of on or so that the their them they this to was we were what when with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, vocab, indptr, doc_ids, weights, n_docs):
+        self.vocab = vocab        # term -> term id
+        self.indptr = indptr      # (n_terms + 1,) start of each term's postings
+        self.doc_ids = doc_ids    # (n_postings,) documents containing each term
+        self.weights = weights    # (n_postings,) idf * saturated tf for that posting
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, texts, k1=K1, b=B):
+        vocab = {}
+        term_ids = []
+        doc_ids = []
+        tfs = []
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[doc] = len(tokens)
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                term_ids.append(vocab.setdefault(tok, len(vocab)))
+                doc_ids.append(doc)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")   # group postings by term, docs stay sorted
+        term_ids = term_ids[order]
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        tfs = np.asarray(tfs, dtype=np.float32)[order]
+
+        df = np.bincount(term_ids, minlength=len(vocab)).astype(np.float32)
+        indptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+        n = max(1, len(texts))
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        avgdl = float(doc_len.mean()) if len(texts) else 1.0
+        norm = k1 * (1 - b + b * doc_len[doc_ids] / max(avgdl, 1e-9))
+        weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+        return cls(vocab, indptr, doc_ids, weights, len(texts))
+
+    def scores(self, query):
+        """BM25 score of every document for the query (zero where no term matches)."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is not None:
+                start, end = self.indptr[t], self.indptr[t + 1]
+                scores[self.doc_ids[start:end]] += self.weights[start:end]  # doc ids are unique per term
+        return scores
+
+    def save(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        for name in ("indptr", "doc_ids", "weights"):
+            tmp = os.path.join(folder, name + ".tmp.npy")
+            np.save(tmp, getattr(self, name))
+            os.replace(tmp, os.path.join(folder, name + ".npy"))
+        tmp = os.path.join(folder, "vocab.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs, "terms": sorted(self.vocab, key=self.vocab.get)}, f)
+        os.replace(tmp, os.path.join(folder, "vocab.json"))
+
+    @classmethod
+    def load(cls, folder):
+        with open(os.path.join(folder, "vocab.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            {term: i for i, term in enumerate(meta["terms"])},
+            np.load(os.path.join(folder, "indptr.npy")),
+            np.load(os.path.join(folder, "doc_ids.npy"), mmap_mode="r"),
+            np.load(os.path.join(folder, "weights.npy"), mmap_mode="r"),
+            meta["n_docs"],
+        )
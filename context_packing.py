@@ -0,0 +1,85 @@
+import re
+import numpy as np
+
+from ivf_index import normalize_rows
+from tracing import estimate_tokens
+
+# Packs retrieved chunks into a prompt under a token budget. Chunks are picked by
+# maximal marginal relevance (relevant to the query, unlike what is already packed),
+# and a chunk that does not fit whole is cut at a sentence boundary instead of
+# being skipped or crowding out everything after it. Relevance is the retriever's
+# own score, so hybrid retrieval's lexical evidence counts; embeddings are only
+# used to measure how redundant two chunks are.
+
+MMR_LAMBDA = 0.7          # 1.0 = pure relevance, lower values favour diversity
+MIN_CHUNK_TOKENS = 24     # don't bother packing a fragment smaller than this
+SEPARATOR = "\n\n"
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+
+def split_sentences(text):
+    return [s for s in SENTENCE_END_RE.split(text.strip()) if s]
+
+
+def trim_to_tokens(text, max_tokens):
+    """Leading whole sentences of `text` that fit in max_tokens ("" if not even one fits)."""
+    kept = ""
+    for sentence in split_sentences(text):
+        longer = kept + " " + sentence if kept else sentence
+        if estimate_tokens(longer) > max_tokens:
+            break
+        kept = longer
+    return kept
+
+
+def relevance_scores(results):
+    """Retrieval scores of `results` min-max normalized to [0, 1], the range of the redundancy term."""
+    scores = np.array([r["score"] for r in results], dtype=np.float32)
+    span = scores.max() - scores.min()
+    return (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+
+
+def mmr_order(relevance, vectors, lambda_=MMR_LAMBDA):
+    """Candidate indices in maximal-marginal-relevance order, produced lazily."""
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = normalize_rows(vectors)
+    redundancy = None  # max similarity to anything picked so far
+    remaining = np.ones(len(vectors), dtype=bool)
+    for _ in range(len(vectors)):
+        mmr = lambda_ * relevance if redundancy is None else lambda_ * relevance - (1 - lambda_) * redundancy
+        mmr[~remaining] = -np.inf
+        pick = int(np.argmax(mmr))
+        remaining[pick] = False
+        yield pick
+        similarity = vectors @ vectors[pick]
+        redundancy = similarity if redundancy is None else np.maximum(redundancy, similarity)
+
+
+def pack_context(results, vectors, token_budget, max_chunks=None, lambda_=MMR_LAMBDA):
+    """
+    Pack retrieve_many() results (ranked by their "score", with their embedding
+    `vectors` for redundancy) into at most `token_budget` estimated tokens. Returns (text, packed results, tokens); a
+    trimmed chunk keeps its original text under "full_text".
+    """
+    if not results:
+        return "", [], 0
+    separator_tokens = estimate_tokens(SEPARATOR)
+    packed = []
+    used = 0
+    for ix in mmr_order(relevance_scores(results), vectors, lambda_):
+        if max_chunks is not None and len(packed) >= max_chunks:
+            break
+        room = token_budget - used - (separator_tokens if packed else 0)
+        if room < MIN_CHUNK_TOKENS:
+            break
+        result = results[ix]
+        tokens = estimate_tokens(result["text"])
+        if tokens > room:
+            text = trim_to_tokens(result["text"], room)
+            if estimate_tokens(text) < MIN_CHUNK_TOKENS:
+                continue  # a later, shorter chunk may still fit
+            result = dict(result, text=text, full_text=result["text"])
+            tokens = estimate_tokens(text)
+        packed.append(result)
+        used += tokens + (separator_tokens if len(packed) > 1 else 0)
+    return SEPARATOR.join(r["text"] for r in packed), packed, used
@@ -0,0 +1,121 @@
+import re
+import hashlib
+import numpy as np
+
+# Exact and near-duplicate chunk detection, run before chunks are embedded.
+# Exact duplicates match on a hash of the whitespace/case-normalized text. Near
+# duplicate candidates come from a 64-bit SimHash of the chunk's word shingles,
+# found through band buckets (two hashes within MAX_DISTANCE bits agree on at
+# least one of MAX_DISTANCE + 1 bands), and are confirmed by the Jaccard overlap
+# of their shingle sets, since short chunks with few shingles can land within
+# MAX_DISTANCE bits of unrelated ones. Templated rows ("Field: value | ...")
+# collapse when they differ in a value or two, not when they are distinct records.
+# Clustering is greedy in corpus order: a chunk joins the first kept chunk it
+# duplicates, so the decisions for a prefix of a corpus never depend on what
+# comes after it.
+
+MAX_DISTANCE = 6          # SimHash bits a near-duplicate candidate may differ in; 0 = exact duplicates only
+MIN_JACCARD = 0.8         # shingle overlap that confirms a candidate as a near duplicate
+SHINGLE_WORDS = 3         # words per shingle
+WORD_RE = re.compile(r"\w+")
+
+_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def exact_key(text):
+    return hashlib.sha1(normalize(text).encode("utf-8")).digest()
+
+
+def _feature_hash(feature, cache):
+    h = cache.get(feature)
+    if h is None:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        cache[feature] = h
+    return h
+
+
+def shingles(text, cache=None):
+    """Set of 64-bit hashes of the text's word shingles."""
+    cache = {} if cache is None else cache
+    words = WORD_RE.findall(text.lower())
+    if len(words) > SHINGLE_WORDS:
+        features = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    else:
+        features = [" ".join(words)]
+    return frozenset(_feature_hash(f, cache) for f in features)
+
+
+def simhash(shingle_hashes):
+    """64-bit SimHash of a shingle set."""
+    hashes = np.fromiter(shingle_hashes, dtype=np.uint64, count=len(shingle_hashes))
+    votes = np.where((hashes[:, None] & _BITS) != 0, 1, -1).sum(axis=0)
+    return int(_BITS[votes > 0].sum()) if (votes > 0).any() else 0
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class Deduplicator:
+    """Assigns each added chunk to a cluster; the first chunk of a cluster is its representative."""
+
+    def __init__(self, max_distance=MAX_DISTANCE, min_jaccard=MIN_JACCARD):
+        self.max_distance = max_distance
+        self.min_jaccard = min_jaccard
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self._exact = {}                                # exact key -> representative
+        self._buckets = [{} for _ in range(self.bands)]  # band value -> representatives
+        self._hashes = {}                               # representative -> (simhash, shingle set)
+        self._features = {}
+        self.n = 0
+
+    def _band_values(self, h):
+        mask = (1 << self.band_bits) - 1
+        return [(h >> (b * self.band_bits)) & mask for b in range(self.bands)]
+
+    def add(self, text):
+        """Index of the representative this chunk belongs to (its own index when it is kept)."""
+        ix = self.n
+        self.n += 1
+        key = exact_key(text)
+        rep = self._exact.get(key)
+        if rep is not None:
+            return rep
+        if self.max_distance > 0:
+            features = shingles(text, self._features)
+            h = simhash(features)
+            bands = self._band_values(h)
+            best = None
+            for b, value in enumerate(bands):
+                for candidate in self._buckets[b].get(value, ()):
+                    if best is not None and candidate >= best:
+                        continue
+                    other_hash, other_features = self._hashes[candidate]
+                    if (bin(h ^ other_hash).count("1") <= self.max_distance
+                            and jaccard(features, other_features) >= self.min_jaccard):
+                        best = candidate
+            if best is not None:
+                self._exact[key] = best
+                return best
+            self._hashes[ix] = (h, features)
+            for b, value in enumerate(bands):
+                self._buckets[b].setdefault(value, []).append(ix)
+        self._exact[key] = ix
+        return ix
+
+
+def deduplicate(texts, max_distance=MAX_DISTANCE, min_jaccard=MIN_JACCARD):
+    """Representative index of every text (equal to its own index for kept texts)."""
+    dedup = Deduplicator(max_distance, min_jaccard)
+    return np.array([dedup.add(t) for t in texts], dtype=np.int64)
+
+
+def cluster_counts(reps):
+    """(kept indices, cluster size of each) from deduplicate()'s representatives."""
+    kept = np.flatnonzero(reps == np.arange(len(reps)))
+    return kept, np.bincount(reps, minlength=len(reps))[kept]
@@ -0,0 +1,120 @@
+"""
+Non-interactive batch mode: replay scripted intake sessions through the same
+pipeline as run_cli() for several models, and write one consolidated results file.
+
+Each line of the sessions JSONL is one scripted patient:
+    {"id": "vignette-01", "first_name": "Jane", "last_name": "Doe", "dob": "01/02/1990",
+     "self_report": "I can't stop checking the stove...",
+     "answers": {"PHQ-4.json": [1, 2, 0, 1], "OCI-R.json": [...], ...}}
+Answers are option indices, exactly what the patient would type. Inventories the
+model selects but the script has no answers for are recorded as skipped.
+
+With --llm-cache, identical LLM requests are answered from llm/llm_cache.py, so a
+rerun over the same scripts only calls the model for prompts it has not seen.
+
+Usage:
+    python -m interface.batch sessions.jsonl --models phi gemma llama3 mistral [--llm-cache]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from interface.cli import build_retriever, open_results_store, run_session
+from llm.local_llm import MODEL_NAME
+
+DEFAULT_WORKERS = 8          # sessions in flight at once
+DEFAULT_MAX_LLM_CALLS = 2    # concurrent requests sent to the Ollama server
+DEFAULT_OUTPUT = "output/batch_results.jsonl"
+
+
+def load_scripts(path):
+    scripts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for ix, line in enumerate(f):
+            if line.strip():
+                script = json.loads(line)
+                script.setdefault("id", f"session-{ix + 1}")
+                scripts.append(script)
+    return scripts
+
+
+async def _run_one(retriever, script, model, session_slots, llm_slots, trace_dir=None, store=None,
+                   use_cache=False):
+    async with session_slots:
+        start = time.perf_counter()
+        record = {"session_id": script["id"], "model": model}
+        trace_path = None
+        if trace_dir is not None:
+            trace_path = os.path.join(trace_dir, f"{script['id']}_{model.replace(':', '-')}.trace.jsonl")
+        try:
+            outcome = await run_session(retriever, script=script, model=model, llm_slots=llm_slots,
+                                        save_csv=False, trace_path=trace_path, store=store,
+                                        use_cache=use_cache)
+            record.update(outcome)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["total_seconds"] = time.perf_counter() - start
+        return record
+
+
+async def run_batch(scripts, models, output_path=DEFAULT_OUTPUT, workers=DEFAULT_WORKERS,
+                    max_llm_calls=DEFAULT_MAX_LLM_CALLS, trace_dir=None, store_dir=None, use_cache=False):
+    """
+    Run every script against every model; records are appended as sessions finish.
+    With `trace_dir`, each session's trace is written there (summarize with python -m tracing),
+    and with `store_dir` every session is appended to that results store.
+    `use_cache` answers repeated LLM requests from the response cache.
+    """
+    loop = asyncio.get_running_loop()
+    # Every in-flight session can hold a couple of worker threads (retrieval + LLM)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers * 2 + max_llm_calls))
+
+    if trace_dir is not None:
+        os.makedirs(trace_dir, exist_ok=True)
+    store = open_results_store(store_dir) if store_dir is not None else None
+    retriever = await asyncio.to_thread(build_retriever)  # shared, read-only across sessions
+    session_slots = asyncio.Semaphore(workers)
+    llm_slots = asyncio.Semaphore(max_llm_calls)
+    jobs = [
+        _run_one(retriever, script, model, session_slots, llm_slots, trace_dir, store, use_cache)
+        for model in models
+        for script in scripts
+    ]
+
+    failures = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for done, job in enumerate(asyncio.as_completed(jobs), start=1):
+            record = await job
+            failures += "error" in record
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            status = "❌ " + record["error"] if "error" in record else f"{record['total_seconds']:.1f}s"
+            print(f"[{done}/{len(jobs)}] {record['session_id']} on {record['model']}: {status}")
+    if store is not None:
+        store.close()
+    print(f"\n✅ {len(jobs) - failures}/{len(jobs)} sessions saved to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay scripted intake sessions across models.")
+    parser.add_argument("sessions", help="JSONL file of scripted sessions")
+    parser.add_argument("--models", nargs="+", default=[MODEL_NAME])
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--max-llm-calls", type=int, default=DEFAULT_MAX_LLM_CALLS)
+    parser.add_argument("--out", default=DEFAULT_OUTPUT)
+    parser.add_argument("--trace-dir", default=None, help="write one trace JSONL per session here")
+    parser.add_argument("--store", default=None, help="also append every session to this results store")
+    parser.add_argument("--llm-cache", action="store_true",
+                        help="replay identical LLM requests from output/llm_cache.sqlite3 (stores responses in plaintext)")
+    args = parser.parse_args()
+
+    scripts = load_scripts(args.sessions)
+    asyncio.run(run_batch(scripts, args.models, args.out, args.workers, args.max_llm_calls,
+                          args.trace_dir, args.store, args.llm_cache))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,51 @@
 import os
-import csv
-import json
 import ast
-import numpy as np
-from sentence_transformers import SentenceTransformer
+import json
+import time
+import asyncio
 
-from llm.local_llm import query_llm
-from utils import load_inventory, administer_inventory, generate_output_filename
+import tracing
+from llm.local_llm import MODEL_NAME, USE_CACHE, query_llm, preload_model
+from utils import load_inventory, administer_inventory, generate_output_filename, generate_csv_output
 
 # ==== RETRIEVAL/CONTEXT CONTROL VARIABLES ====
 # --------------------------------------------------------------
 # >>> TUNE THESE FOR EACH LLM TESTED <<<
-MAX_TOTAL_CHARS_CONTEXT = 1800   # per context injection
-RETRIEVAL_TOP_N = 6             # How many top relevant chunks to inject each time
+MAX_CONTEXT_TOKENS = 450       # per context injection (estimated model tokens, ~1800 chars)
+RETRIEVAL_TOP_N = 6             # Max chunks to inject each time (MMR-picked, trimmed to fit the budget)
 RETRIEVER_MODEL = "all-MiniLM-L6-v2"   # can upgrade for larger LLMs
-RETRIEVER_MAX_CHUNKS = 600      # higher for lots of data
+RETRIEVER_MAX_CHUNKS = None     # None = index the full corpus (ANN search kicks in for large corpora)
+RETRIEVER_INDEX_DIR = "Data/index_cache"   # persisted embeddings, rebuilt only for changed files
 # --------------------------------------------------------------
+RESULTS_STORE_DIR = "output/results_store"   # columnar store every saved session is appended to
+# Inventory selection is a short JSON list: cap the reply and stop at the first blank line
+SELECTION_OPTIONS = {"num_predict": 96, "stop": ["\n\n"]}
 
+# Disorder partition each inventory screens for; once inventories are chosen the
+# summary context is retrieved from those partitions only
+INVENTORY_DISORDERS = {
+    "ACE-Q.json": "ptsd",
+    "AQ-10.json": "asd",
+    "ASRS_v1.1.json": "adhd",
+    "ASSIST.json": "substance_use",
+    "AUDIT.json": "substance_use",
+    "BAI.json": "anxiety_panic",
+    "BDI-2.json": "depression",
+    "DAST-10.json": "substance_use",
+    "DES-II.json": "ptsd",
+    "GAD-7.json": "anxiety_panic",
+    "IES-R.json": "ptsd",
+    "MDQ.json": "bipolar",
+    "OCI-R.json": "ocd",
+    "PCL-5.json": "ptsd",
+    "PDSS_SR.json": "anxiety_panic",
+    "PHQ-9.json": "depression",
+    "PID-5-BF.json": "personality_pathology",
+    "PQ-B.json": "psychotic_disorders",
+    "QIDS-SR-16.json": "depression",
+    "SPIN.json": "anxiety_panic",
+}
 
-class SemanticRetriever:
-    def __init__(self, folders, max_chunks=600, embed_model=RETRIEVER_MODEL):
-        self.folders = folders
-        self.model = SentenceTransformer(embed_model)
-        self.chunks = []
-        self.chunk_sources = []
-        self.embeddings = None
-        self._index_chunks(max_chunks)
-
-    def _index_chunks(self, max_chunks):
-        all_chunks = []
-        sources = []
-        for folder in self.folders:
-            for filename in sorted(os.listdir(folder)):
-                if filename.endswith('.jsonl'):
-                    path = os.path.join(folder, filename)
-                    with open(path, 'r', encoding='utf-8') as f:
-                        for ix, line in enumerate(f):
-                            try:
-                                obj = json.loads(line)
-                                text = obj.get("text", "")
-                                if text and isinstance(text, str):
-                                    all_chunks.append(text.strip())
-                                    sources.append((filename, ix))
-                                if len(all_chunks) >= max_chunks:
-                                    break
-                            except Exception:
-                                continue
-                if len(all_chunks) >= max_chunks:
-                    break
-            if len(all_chunks) >= max_chunks:
-                break
-        self.chunks = all_chunks
-        self.chunk_sources = sources
-        self.embeddings = self.model.encode(self.chunks, show_progress_bar=False)
-
-    def retrieve(self, query, top_n=RETRIEVAL_TOP_N, max_total_chars=MAX_TOTAL_CHARS_CONTEXT):
-        q_emb = self.model.encode([query])[0]
-        sims = np.inner(self.embeddings, q_emb)
-        top_ids = np.argsort(sims)[::-1][:top_n]
-        results = []
-        chars = 0
-        for idx in top_ids:
-            chunk = self.chunks[idx]
-            if chars + len(chunk) > max_total_chars:
-                break
-            results.append(chunk)
-            chars += len(chunk)
-        return results
 
 # ==== FILE UTILS ====
 def list_json_files(folder_path, exclude=None):
@@ -88,66 +67,75 @@ def get_self_report():
     print("\nPlease describe what brings you in today (your symptoms and concerns):")
     return input("> ")
 
-def generate_csv_output(patient_info, self_report, assessment_summary, results, filename="output/results.csv"):
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "w", newline='', encoding="utf-8") as f:
-        writer = csv.writer(f)
-        metadata_row = [
-            f"{patient_info[0]} {patient_info[1]}",
-            patient_info[2],
-            self_report,
-            assessment_summary
-        ]
-        writer.writerow(metadata_row)
-        max_qs = max(len(r["question_scores"]) for r in results)
-        header_row = ["assessment name", "total score"] + [f"q{i+1} score" for i in range(max_qs)]
-        writer.writerow(header_row)
-        for r in results:
-            row = [r["name"], r["total_score"]] + r["question_scores"]
-            row += [""] * (len(header_row) - len(row))
-            writer.writerow(row)
-    print(f"\n✅ Results saved to {filename}")
+def build_retriever():
+    from retrieval import SemanticRetriever  # numpy, BM25/IVF indexes: off the startup path
 
-# ==== MAIN INTERACTIVE FLOW ====
-def run_cli():
-    # ---- Set up retriever at session start ----
     dsm5_folder = "Data/dsm5_chunks/"
     dataset_folder = "Data/dataset_chunks/"
-    retriever = SemanticRetriever(
+    return SemanticRetriever(
         [dsm5_folder, dataset_folder],
-        max_chunks=RETRIEVER_MAX_CHUNKS
+        max_chunks=RETRIEVER_MAX_CHUNKS,
+        embed_model=RETRIEVER_MODEL,
+        index_dir=RETRIEVER_INDEX_DIR
     )
-    inventories_folder = "inventories"
-    available_files = list_json_files(inventories_folder, exclude={"PHQ-4.json"})
 
-    # ---- intake ----
-    patient_info = get_patient_info()
-    self_report = get_self_report()
+def inventory_prefilter(retriever):
+    """Item-text similarity pre-filter over the inventories, in the retriever's embedding space."""
+    from inventory_prefilter import load_prefilter
 
-    # ---- PHQ-4 always first ----
-    print("\nThank you for sharing this with me. I will now administer PHQ-4, a brief assessment, to better understand your experience.")
-    phq4_inventory = load_inventory("inventories/PHQ-4.json")
-    phq4_result = administer_inventory(phq4_inventory)
+    return load_prefilter("inventories", retriever.embed_model,
+                          lambda texts: retriever.model.encode(texts, show_progress_bar=False))
 
-    # ---- RETRIEVE RELEVANT CONTEXT ----
-    context_query = (
+def _warm_retriever():
+    """Build the retriever, load its embedding model and the pre-filter (run in the background during intake)."""
+    retriever = build_retriever()
+    retriever.warm_up()
+    inventory_prefilter(retriever)
+    return retriever
+
+def _preload_llm(model=MODEL_NAME):
+    try:
+        preload_model(model)
+    except Exception as e:
+        print(f"⚠️ Could not preload the model: {e}")
+
+def open_results_store(root=None):
+    """The columnar results store (RESULTS_STORE_DIR by default), or None when pyarrow is not installed."""
+    try:
+        from results_store import ResultsStore
+    except ImportError as e:
+        print(f"⚠️ Results store unavailable ({e}); only the CSV is written.")
+        return None
+    return ResultsStore(root or RESULTS_STORE_DIR)
+
+def _silent(*args, **kwargs):
+    pass
+
+async def _traced(stage, awaitable):
+    """Await in a span, so background tasks get their own stage in the trace."""
+    with tracing.span(stage):
+        return await awaitable
+
+async def _ask_llm(prompt, model, llm_slots=None, **kwargs):
+    if llm_slots is None:
+        return await asyncio.to_thread(query_llm, prompt, model, **kwargs)
+    async with llm_slots:
+        return await asyncio.to_thread(query_llm, prompt, model, **kwargs)
+
+# ==== PROMPTS (shared with interface/server.py) ====
+def context_query(self_report, phq4_result):
+    return (
         "Patient self-report: " + self_report + "\n"
         + "PHQ-4 total score: " + str(phq4_result.get('total_score', 'N/A')) + "\n"
         + "PHQ-4 question scores: " + str(phq4_result.get('question_scores', []))
     )
-    retrieved_context = retriever.retrieve(
-        context_query,
-        top_n=RETRIEVAL_TOP_N,
-        max_total_chars=MAX_TOTAL_CHARS_CONTEXT
-    )
-    context_text = "\n\n".join(retrieved_context)
 
-    # ---- LLM selects inventories ----
-    prompt = (
+def selection_prompt(context_text, available_files, self_report, phq4_result):
+    return (
         "You are an expert mental health chatbot triage assistant. "
         "Given the DSM-5 and dataset context below, the patient self-report, and PHQ-4 scores, "
         "select from the following list of inventory filenames ALL those relevant to administer next "
-        "in addition to PHQ-4. Respond ONLY with a valid Python list of filenames; no commentary.\n\n"
+        "in addition to PHQ-4. Respond ONLY with JSON; no commentary.\n\n"
         "--- Clinical Context ---\n"
         f"{context_text}\n\n"
         "--- Inventories (JSON filenames) ---\n"
@@ -155,66 +143,268 @@ def run_cli():
         "--- Patient self-report ---\n"
         f"{self_report}\n\n"
         f"PHQ-4 total: {phq4_result.get('total_score', 'N/A')}, Question scores: {phq4_result.get('question_scores', [])}\n"
-        "Reply ONLY with a single valid Python list containing only valid filenames with ABSOLUTELY NO additional commentary. For example, ['file1.json', 'file2.json']"
+        'Reply ONLY with a single JSON object listing valid filenames with ABSOLUTELY NO additional commentary. For example, {"inventories": ["file1.json", "file2.json"]}'
     )
 
-    inventories_response = query_llm(prompt).strip()
-    # print(f"\nRaw LLM inventory selection response: {inventories_response}")
+def selection_schema(available_files):
+    """JSON schema for the selection reply: a list drawn from `available_files` only."""
+    return {
+        "type": "object",
+        "properties": {
+            "inventories": {"type": "array", "items": {"type": "string", "enum": list(available_files)}},
+        },
+        "required": ["inventories"],
+    }
 
-    try:
-        chosen_inventories = ast.literal_eval(inventories_response)
-        if not isinstance(chosen_inventories, list):
-            raise ValueError("Parsed result is not a list")
-    except Exception:
-        print("⚠️ Failed to parse LLM response as Python list. No additional inventories will be administered.")
-        chosen_inventories = []
+def selection_candidates(retriever, self_report, available_files, query_embeddings=None):
+    """
+    (candidates, fallback) from the item-text pre-filter: the inventories offered to
+    the LLM, closest to the self-report first, and those to administer if its reply
+    can't be parsed. `query_embeddings` is the self-report's encode_queries() row,
+    if the caller already has it.
+    """
+    from inventory_prefilter import candidates, fallback
 
-    # Only administer files that exist in your folder
-    chosen_inventories = [f for f in chosen_inventories if f in available_files]
+    prefilter = inventory_prefilter(retriever)
+    if query_embeddings is None:
+        query_embeddings = retriever.encode_queries([self_report])
+    ranked = prefilter.rank(query_embeddings[0], available_files)
+    return candidates(ranked), fallback(ranked)
 
-    if chosen_inventories:
-        print("\nThank you for your responses. The following additional questions will help me understand your situation further.")
-        for inv in chosen_inventories:
-            print(f"- {inv}")
-    else:
-        print("\nNo additional inventories will be administered based on the current information.")
-
-    results = [phq4_result]
-    for filename in chosen_inventories:
+def parse_selection(response, available_files):
+    """
+    The chosen inventory files that exist, or None if the reply is neither the
+    selection JSON nor a Python list (backends that ignore the schema).
+    """
+    try:
+        chosen = json.loads(response)
+        if isinstance(chosen, dict):
+            chosen = chosen.get("inventories")
+    except ValueError:
         try:
-            # print(f"\nNow administering: {filename}")
-            inventory = load_inventory(os.path.join(inventories_folder, filename))
-            res = administer_inventory(inventory)
-            results.append(res)
-        except Exception as e:
-            print(f"❌ Failed to administer {filename}: {e}")
-
-    # ---- Retrieve context for summary as well ----
-    summary_context = retriever.retrieve(
-        self_report,
-        top_n=RETRIEVAL_TOP_N,
-        max_total_chars=MAX_TOTAL_CHARS_CONTEXT
-    )
-    summary_context_text = "\n\n".join(summary_context)
+            chosen = ast.literal_eval(response)
+        except Exception:
+            return None
+    if not isinstance(chosen, list):
+        return None
+    # Only administer files that exist in your folder
+    return [f for f in chosen if f in available_files]
+
+def summary_filters(chosen_inventories):
+    """Restrict the summary context to the disorders the chosen inventories screen for."""
+    disorders = {INVENTORY_DISORDERS[f] for f in chosen_inventories if f in INVENTORY_DISORDERS}
+    return {"disorder": disorders} if disorders else None
 
-    summary_prompt = (
+def summary_prompt(context_text, self_report, results):
+    return (
         "You are an expert mental health chatbot assisting clinicians. "
         "Based on the clinical context, the patient's self report, "
         "and the administered inventory scores below, write a concise diagnostic impression (2-4 sentences). "
         "Avoid naming specific inventories or stating raw scores.\n\n"
         "--- Clinical Context ---\n"
-        f"{summary_context_text}\n\n"
+        f"{context_text}\n\n"
         "--- Self-report ---\n"
         f"{self_report}\n\n"
         "--- Inventory scores summary ---\n"
         f"{[{r['name']: r['total_score']} for r in results]}"
     )
-    diagnostic_impression = query_llm(summary_prompt)
-    print("Thank you for speaking with me and completing the assessments. Your provider will share the results with you directly.")
-    # print(diagnostic_impression)
 
-    filename = generate_output_filename(patient_info[0], patient_info[1], patient_info[2])
-    generate_csv_output(patient_info, self_report, diagnostic_impression, results, filename)
+# ==== MAIN INTERACTIVE FLOW ====
+def run_cli():
+    asyncio.run(run_session())
+
+async def run_session(retriever=None, script=None, model=MODEL_NAME, llm_slots=None, save_csv=True,
+                      trace_path=None, store=None, use_cache=USE_CACHE):
+    """
+    One intake session as an asyncio pipeline. Patient-facing steps and blocking
+    work (retrieval, LLM calls, file I/O) run on worker threads, so anything whose
+    inputs already exist starts in the background instead of waiting its turn.
+
+    `script` replays a recorded session (see interface/batch.py) instead of prompting
+    on stdin, and `llm_slots` is an optional semaphore bounding concurrent LLM calls
+    across sessions. Returns a dict describing the session with per-stage latency.
+
+    Every stage is a span in a per-session trace (see tracing.py), written next to
+    the CSV as <name>.trace.jsonl, or to `trace_path` when given.
+
+    Saved sessions are also appended to the results store (see results_store.py):
+    `store` if given, otherwise the default store when save_csv is set. The scores
+    are saved (CSV and store) while the impression is generated, and the impression
+    is filled in once it arrives.
+
+    `use_cache` replays identical LLM requests from llm/llm_cache.py; it is off by
+    default so a live patient never gets another patient's impression.
+    """
+    tracer = tracing.Tracer(
+        session_id=script.get("id") if script is not None else None,
+        model=model,
+        started=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+    owns_store = store is None and save_csv
+    if owns_store:
+        store = await asyncio.to_thread(open_results_store)
+    try:
+        with tracer.activate():
+            outcome = await _run_session(retriever, script, model, llm_slots, save_csv, tracer, store, use_cache)
+        tracer.info["duration_s"] = tracer.elapsed()
+        tracer.info["chosen_inventories"] = outcome["chosen_inventories"]
+        if trace_path is None and save_csv:
+            trace_path = os.path.splitext(outcome["output_file"])[0] + ".trace.jsonl"
+        if trace_path is not None:
+            await asyncio.to_thread(tracer.write, trace_path)
+        outcome["timings"] = tracer.stage_totals()
+        outcome["counters"] = dict(tracer.counters)
+        outcome["trace_file"] = trace_path
+        if store is not None:
+            await asyncio.to_thread(store.update_session, outcome["store_session_id"],
+                                    diagnostic_impression=outcome["diagnostic_impression"],
+                                    timings=outcome["timings"])
+    finally:
+        if owns_store and store is not None:
+            store.close()
+    return outcome
+
+async def _run_session(retriever, script, model, llm_slots, save_csv, tracer, store, use_cache):
+    say = print if script is None else _silent
+
+    # ---- Warm up the LLM and the retriever in the background while the patient types ----
+    preload_task = None
+    if script is None:
+        preload_task = asyncio.create_task(_traced("llm_preload", asyncio.to_thread(_preload_llm, model)))
+    retriever_task = None
+    if retriever is None:
+        retriever_task = asyncio.create_task(_traced("retriever_setup", asyncio.to_thread(_warm_retriever)))
+    inventories_folder = "inventories"
+    available_files = list_json_files(inventories_folder, exclude={"PHQ-4.json"})
+
+    # ---- intake ----
+    if script is None:
+        with tracer.span("intake"):
+            patient_info = await asyncio.to_thread(get_patient_info)
+            self_report = await asyncio.to_thread(get_self_report)
+    else:
+        patient_info = (script["first_name"], script["last_name"], script["dob"])
+        self_report = script["self_report"]
+    answers = script.get("answers", {}) if script is not None else {}
+    if script is not None and "PHQ-4.json" not in answers:
+        raise ValueError("scripted session has no answers for PHQ-4.json")
+
+    # ---- PHQ-4 always first ----
+    say("\nThank you for sharing this with me. I will now administer PHQ-4, a brief assessment, to better understand your experience.")
+    phq4_inventory = load_inventory("inventories/PHQ-4.json")
+    with tracer.span("phq4"):
+        phq4_result = await asyncio.to_thread(administer_inventory, phq4_inventory, answers.get("PHQ-4.json"))
+
+    # ---- RETRIEVE RELEVANT CONTEXT (and pre-filter inventories alongside) ----
+    if retriever_task is not None:
+        with tracer.span("retriever_wait"):
+            retriever = await retriever_task
+    # The self-report is encoded once, for both the pre-filter and the summary context
+    def prefilter():
+        report_embedding = retriever.encode_queries([self_report])
+        return report_embedding, selection_candidates(retriever, self_report, available_files, report_embedding)
+
+    prefilter_task = asyncio.create_task(_traced("inventory_prefilter", asyncio.to_thread(prefilter)))
+    with tracer.span("context_retrieval"):
+        context_text, _, context_tokens = await asyncio.to_thread(
+            retriever.retrieve_context,
+            context_query(self_report, phq4_result),
+            MAX_CONTEXT_TOKENS,
+            top_n=RETRIEVAL_TOP_N
+        )
+
+    # ---- LLM selects inventories, from the pre-filtered candidates ----
+    report_embedding, (candidates, fallback) = await prefilter_task
+    prompt = selection_prompt(context_text, candidates, self_report, phq4_result)
+    with tracer.span("inventory_selection", candidates=len(candidates)) as attrs:
+        if preload_task is not None:
+            await preload_task
+        inventories_response = (await _ask_llm(prompt, model, llm_slots, options=SELECTION_OPTIONS,
+                                               format=selection_schema(candidates), use_cache=use_cache)).strip()
+        # print(f"\nRaw LLM inventory selection response: {inventories_response}")
+
+        chosen_inventories = parse_selection(inventories_response, candidates)
+        attrs["fallback"] = chosen_inventories is None
+    if chosen_inventories is None:
+        say("⚠️ Failed to parse the LLM's inventory selection. Administering the closest-matching inventories instead.")
+        chosen_inventories = fallback
+
+    # ---- Summary context: fetched during administration, from the chosen disorders only ----
+    summary_context_task = asyncio.create_task(_traced("summary_retrieval", asyncio.to_thread(
+        retriever.retrieve_context,
+        self_report,
+        MAX_CONTEXT_TOKENS,
+        top_n=RETRIEVAL_TOP_N,
+        filters=summary_filters(chosen_inventories),
+        query_embeddings=report_embedding
+    )))
+
+    # ---- Prefetch every chosen inventory while the first one is administered ----
+    inventory_tasks = {
+        filename: asyncio.create_task(asyncio.to_thread(load_inventory, os.path.join(inventories_folder, filename)))
+        for filename in chosen_inventories
+    }
+
+    if chosen_inventories:
+        say("\nThank you for your responses. The following additional questions will help me understand your situation further.")
+        for inv in chosen_inventories:
+            say(f"- {inv}")
+    else:
+        say("\nNo additional inventories will be administered based on the current information.")
+
+    results = [phq4_result]
+    skipped = []
+    with tracer.span("inventories", count=len(chosen_inventories)):
+        for filename in chosen_inventories:
+            if script is not None and filename not in answers:
+                skipped.append(filename)  # the script has no answers for this inventory
+                continue
+            try:
+                # print(f"\nNow administering: {filename}")
+                with tracer.span("administer_inventory", inventory=filename):
+                    inventory = await inventory_tasks[filename]
+                    res = await asyncio.to_thread(administer_inventory, inventory, answers.get(filename))
+                results.append(res)
+            except Exception as e:
+                say(f"❌ Failed to administer {filename}: {e}")
+                skipped.append(filename)
+
+    with tracer.span("summary_retrieval_wait"):
+        summary_context_text, _, summary_context_tokens = await summary_context_task
+
+    # ---- The patient is done: generate the impression in the background ----
+    prompt = summary_prompt(summary_context_text, self_report, results)
+    summary_task = asyncio.create_task(_traced("summary_generation", _ask_llm(prompt, model, llm_slots, use_cache=use_cache)))
+    say("Thank you for speaking with me and completing the assessments. Your provider will share the results with you directly.")
+
+    filename = generate_output_filename(patient_info[0], patient_info[1], patient_info[2], model)
+    outcome = {
+        "patient_info": list(patient_info),
+        "self_report": self_report,
+        "model": model,
+        "chosen_inventories": chosen_inventories,
+        "skipped_inventories": skipped,
+        "results": results,
+        "diagnostic_impression": "",
+        "output_file": filename if save_csv else None,
+        "context_tokens": {"inventory_selection": context_tokens, "summary": summary_context_tokens},
+    }
+
+    # ---- Persist the scores while the impression generates; it is filled in below ----
+    with tracer.span("save_scores"):
+        if save_csv:
+            await asyncio.to_thread(generate_csv_output, patient_info, self_report, "", results, filename, quiet=True)
+        if store is not None:
+            outcome["store_session_id"] = await asyncio.to_thread(store.append_session, outcome)
+
+    with tracer.span("diagnostic_impression"):
+        outcome["diagnostic_impression"] = await summary_task
+    # print(outcome["diagnostic_impression"])
+    if save_csv:
+        with tracer.span("save"):
+            await asyncio.to_thread(generate_csv_output, patient_info, self_report,
+                                    outcome["diagnostic_impression"], results, filename)
+    return outcome
 
 if __name__ == "__main__":
     run_cli()
@@ -0,0 +1,471 @@
+"""
+Long-running HTTP server hosting many intake sessions over the same inventory flow
+as run_cli(). One read-only retriever (model, embeddings, indexes) is shared by
+every session, query embeddings from concurrent sessions are coalesced into
+micro-batches, and LLM calls go through one bounded priority queue, so a patient
+waiting on screen is served before background summaries.
+
+JSON API:
+    POST /sessions                 {"first_name", "last_name", "dob", "self_report"}
+                                   -> {"session_id", "status", "question"}
+    POST /sessions/<id>/answers    {"answer": option index}
+                                   -> {"session_id", "status", "question"} until the last
+                                      answer, then {"status": "summarizing", "message"}
+    GET  /sessions/<id>            session state; results and impression once "complete"
+    GET  /stats                    active sessions, LLM queue depth, embedding batch sizes
+A "question" is {"inventory", "instructions", "number", "of", "id", "text", "options"}.
+When the LLM queue is full, new sessions and answers get HTTP 503 and can be retried.
+
+Usage (from the project root):
+    python -m interface.server --port 8765 --model phi
+"""
+import json
+import time
+import uuid
+import queue
+import argparse
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+import tracing
+from interface.cli import (
+    MAX_CONTEXT_TOKENS, RETRIEVAL_TOP_N, SELECTION_OPTIONS, build_retriever, context_query, inventory_prefilter,
+    list_json_files, open_results_store, parse_selection, selection_candidates, selection_prompt, selection_schema,
+    summary_filters, summary_prompt,
+)
+from llm.local_llm import MODEL_NAME, query_llm, preload_model
+from utils import administer_inventory, generate_csv_output, generate_output_filename, load_inventory
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+INVENTORIES_FOLDER = "inventories"
+EMBED_BATCH_SIZE = 32          # max queries encoded in one call
+EMBED_BATCH_WAIT_MS = 5        # how long a query waits for others to join its batch
+LLM_WORKERS = 2                # concurrent requests sent to the Ollama server
+LLM_QUEUE_SIZE = 64            # pending LLM calls before requests are turned away (HTTP 503)
+SESSION_IDLE_SECONDS = 3600    # sessions are dropped after this long without an answer, or after completing
+SUMMARY_QUEUE_TIMEOUT = 30     # seconds a finished session waits for room in the LLM queue for its impression
+
+# LLM queue priorities, lowest first
+PRIORITY_INTERACTIVE = 0       # inventory selection, the patient is waiting for the next question
+PRIORITY_BACKGROUND = 1        # diagnostic impression, the patient has already finished
+
+THANK_YOU = ("Thank you for speaking with me and completing the assessments. "
+             "Your provider will share the results with you directly.")
+
+
+class MicroBatcher:
+    """Coalesces concurrent encode() calls into one model call per micro-batch."""
+
+    def __init__(self, encode, max_batch=EMBED_BATCH_SIZE, max_wait_ms=EMBED_BATCH_WAIT_MS):
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self.stats = {"batches": 0, "texts": 0, "max_batch": 0}
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def encode(self, texts):
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                size += len(batch[-1][0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = np.asarray(self._encode(texts))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(texts))
+
+
+class LLMQueue:
+    """Bounded priority queue in front of the Ollama server, drained by a few worker threads."""
+
+    def __init__(self, workers=LLM_WORKERS, maxsize=LLM_QUEUE_SIZE, use_cache=False):
+        self._queue = queue.PriorityQueue(maxsize=maxsize)
+        self.use_cache = use_cache  # live sessions get a fresh reply, never one replayed from llm_cache
+        self._order = itertools.count()  # FIFO within a priority
+        self.stats = {"completed": 0, "rejected": 0}
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"llm-worker-{i}", daemon=True).start()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def full(self):
+        return self._queue.full()
+
+    def submit(self, prompt, model, priority=PRIORITY_INTERACTIVE, timeout=None, **kwargs):
+        """
+        Future of the query_llm() reply. Raises queue.Full when the queue is at capacity,
+        straight away or, with a `timeout`, once no slot has freed up within that many seconds.
+        """
+        future = Future()
+        # The caller's context travels with the request, so its spans land in the caller's trace
+        item = (priority, next(self._order), prompt, model, kwargs, contextvars.copy_context(),
+                time.perf_counter(), future)
+        try:
+            self._queue.put(item, block=timeout is not None, timeout=timeout)
+        except queue.Full:
+            self.stats["rejected"] += 1
+            raise
+        return future
+
+    def _call(self, prompt, model, kwargs, enqueued):
+        tracing.count("llm.queue_wait_s", time.perf_counter() - enqueued)
+        return query_llm(prompt, model, use_cache=self.use_cache, **kwargs)
+
+    def _work(self):
+        while True:
+            _, _, prompt, model, kwargs, context, enqueued, future = self._queue.get()
+            try:
+                future.set_result(context.run(self._call, prompt, model, kwargs, enqueued))
+            except Exception as e:
+                future.set_exception(e)
+            self.stats["completed"] += 1
+
+
+class IntakeSession:
+    def __init__(self, patient_info, self_report, model, phq4):
+        self.id = uuid.uuid4().hex
+        self.patient_info = patient_info
+        self.self_report = self_report
+        self.model = model
+        self.status = "in_progress"    # -> "summarizing" -> "complete"
+        self.pending = [("PHQ-4.json", phq4)]  # (filename, inventory) still to administer
+        self.answers = []              # option indices for pending[0]
+        self.results = []
+        self.chosen = []
+        self.context_tokens = {}
+        self.report_embedding = None   # the self-report's query embedding, shared by selection and summary
+        self.outcome = None
+        self.lock = threading.Lock()
+        self.last_seen = time.time()
+        self.tracer = tracing.Tracer(session_id=self.id, model=model, started=time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    def question(self):
+        _, inventory = self.pending[0]
+        q = inventory["questions"][len(self.answers)]
+        return {
+            "inventory": inventory["title"],
+            "instructions": inventory.get("instructions", ""),
+            "number": len(self.answers) + 1,
+            "of": len(inventory["questions"]),
+            "id": q["id"],
+            "text": q["text"],
+            "options": [o["label"] for o in q["options"]],
+        }
+
+
+class IntakeServer:
+    """Session logic behind the HTTP handler; usable directly from Python as well."""
+
+    def __init__(self, retriever=None, model=MODEL_NAME, llm_workers=LLM_WORKERS,
+                 llm_queue_size=LLM_QUEUE_SIZE, save_csv=True, store=None, use_cache=False):
+        self.retriever = retriever if retriever is not None else build_retriever()
+        self.batcher = MicroBatcher(
+            lambda texts: self.retriever.model.encode(texts, batch_size=EMBED_BATCH_SIZE, show_progress_bar=False)
+        )
+        self.retriever.query_encoder = self.batcher.encode
+        self.retriever.warm_up()
+        inventory_prefilter(self.retriever)
+        self.llm = LLMQueue(llm_workers, llm_queue_size, use_cache)
+        self.model = model
+        self.save_csv = save_csv
+        self.store = store if store is not None or not save_csv else open_results_store()
+        # Inventories are read-only, so every session shares one parsed copy
+        self.inventories = {
+            f: load_inventory(f"{INVENTORIES_FOLDER}/{f}") for f in list_json_files(INVENTORIES_FOLDER)
+        }
+        self.available_files = [f for f in self.inventories if f != "PHQ-4.json"]
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    # ---- session lifecycle ----
+    def start_session(self, payload):
+        missing = [k for k in ("first_name", "last_name", "dob", "self_report") if not payload.get(k)]
+        if missing:
+            raise ValueError(f"missing fields: {', '.join(missing)}")
+        if self.llm.full():
+            raise queue.Full  # don't start a session that could not get its inventory selection
+        session = IntakeSession(
+            (payload["first_name"], payload["last_name"], payload["dob"]),
+            payload["self_report"],
+            payload.get("model") or self.model,
+            self.inventories["PHQ-4.json"],
+        )
+        with self._lock:
+            self._evict_idle()
+            self.sessions[session.id] = session
+        return {"session_id": session.id, "status": session.status, "question": session.question()}
+
+    def _evict_idle(self):
+        cutoff = time.time() - SESSION_IDLE_SECONDS
+        for sid in [sid for sid, s in self.sessions.items() if s.status != "summarizing" and s.last_seen < cutoff]:
+            del self.sessions[sid]
+
+    def _session(self, session_id):
+        with self._lock:
+            return self.sessions[session_id]  # KeyError -> 404
+
+    def answer(self, session_id, answer):
+        session = self._session(session_id)
+        summary = failure = None
+        with session.lock, session.tracer.activate():
+            if session.status != "in_progress":
+                raise ValueError(f"session is {session.status}")
+            filename, inventory = session.pending[0]
+            options = inventory["questions"][len(session.answers)]["options"]
+            if not isinstance(answer, int) or not 0 <= answer < len(options):
+                raise ValueError(f"answer must be an option index from 0 to {len(options) - 1}")
+            answers = session.answers + [answer]
+
+            if len(answers) == len(inventory["questions"]):
+                with session.tracer.span("administer_inventory", inventory=filename):
+                    result = administer_inventory(inventory, answers)
+                # Selection can be turned away (queue.Full -> 503); the session is only updated
+                # once it has succeeded, so the patient can resend the same answer
+                chosen = self._select_inventories(session, result) if filename == "PHQ-4.json" else None
+                session.results.append(result)
+                session.pending.pop(0)
+                answers = []
+                if chosen is not None:
+                    session.chosen = chosen
+                    session.pending.extend((f, self.inventories[f]) for f in chosen)
+            session.answers = answers
+            session.last_seen = time.time()
+            if session.pending:
+                return {"session_id": session.id, "status": session.status, "question": session.question()}
+            try:
+                summary = self._summary_prompt(session)
+            except Exception as e:
+                failure = e  # the session still completes, with the error in place of the impression
+            session.status = "summarizing"
+
+        # Outside the session lock: the submit may wait for a queue slot, and a future that
+        # is already done runs _complete (which takes the lock) on this thread
+        with session.tracer.activate():
+            if failure is None:
+                try:
+                    future = self.llm.submit(summary, session.model, PRIORITY_BACKGROUND,
+                                             timeout=SUMMARY_QUEUE_TIMEOUT)
+                except queue.Full:
+                    # The patient is done either way; save the scores with the error as the impression
+                    failure = RuntimeError(f"LLM queue still full after {SUMMARY_QUEUE_TIMEOUT}s")
+            if failure is not None:
+                future = Future()
+                future.set_exception(failure)
+        future.add_done_callback(lambda f: self._complete(session, f))
+        return {"session_id": session.id, "status": "summarizing", "message": THANK_YOU}
+
+    def _select_inventories(self, session, phq4_result):
+        """Inventories to administer after the PHQ-4; leaves the session's pending list to the caller."""
+        with session.tracer.span("context_retrieval"):
+            context_text, _, tokens = self.retriever.retrieve_context(
+                context_query(session.self_report, phq4_result), MAX_CONTEXT_TOKENS, top_n=RETRIEVAL_TOP_N
+            )
+        session.context_tokens["inventory_selection"] = tokens
+        with session.tracer.span("inventory_prefilter"):
+            session.report_embedding = self.retriever.encode_queries([session.self_report])
+            candidates, fallback = selection_candidates(self.retriever, session.self_report, self.available_files,
+                                                        session.report_embedding)
+        prompt = selection_prompt(context_text, candidates, session.self_report, phq4_result)
+        with session.tracer.span("inventory_selection", candidates=len(candidates)) as attrs:
+            response = self.llm.submit(prompt, session.model, PRIORITY_INTERACTIVE, options=SELECTION_OPTIONS,
+                                       format=selection_schema(candidates)).result().strip()
+            chosen = parse_selection(response, candidates)
+            attrs["fallback"] = chosen is None
+        return fallback if chosen is None else chosen
+
+    def _summary_prompt(self, session):
+        """The impression prompt for a session whose inventories are all answered."""
+        with session.tracer.span("summary_retrieval"):
+            context_text, _, tokens = self.retriever.retrieve_context(
+                session.self_report, MAX_CONTEXT_TOKENS, top_n=RETRIEVAL_TOP_N,
+                filters=summary_filters(session.chosen), query_embeddings=session.report_embedding
+            )
+        session.context_tokens["summary"] = tokens
+        return summary_prompt(context_text, session.self_report, session.results)
+
+    def _complete(self, session, future):
+        try:
+            impression = future.result()
+        except Exception as e:
+            impression = f"Error during model execution: {e}"
+        with session.lock, session.tracer.activate():
+            filename = generate_output_filename(*session.patient_info, session.model)
+            outcome = {
+                "session_id": session.id,
+                "patient_info": list(session.patient_info),
+                "self_report": session.self_report,
+                "model": session.model,
+                "chosen_inventories": session.chosen,
+                "skipped_inventories": [],
+                "results": session.results,
+                "diagnostic_impression": impression,
+                "output_file": filename if self.save_csv else None,
+                "context_tokens": session.context_tokens,
+            }
+            try:
+                if self.save_csv:
+                    with session.tracer.span("save"):
+                        generate_csv_output(session.patient_info, session.self_report, impression,
+                                            session.results, filename)
+                    session.tracer.info["duration_s"] = session.tracer.elapsed()
+                    session.tracer.write(filename[:-len(".csv")] + ".trace.jsonl")
+                outcome["timings"] = session.tracer.stage_totals()
+                if self.store is not None:
+                    outcome["store_session_id"] = self.store.append_session(outcome)
+            except Exception as e:
+                print(f"❌ Failed to save session {session.id}: {e}")
+            session.outcome = outcome
+            session.status = "complete"
+            session.last_seen = time.time()
+
+    def get(self, session_id):
+        session = self._session(session_id)
+        with session.lock:
+            if session.outcome is not None:
+                return dict(session.outcome, status=session.status)
+            return {
+                "session_id": session.id,
+                "status": session.status,
+                "chosen_inventories": session.chosen,
+                "completed_inventories": [r["name"] for r in session.results],
+                "question": session.question() if session.status == "in_progress" else None,
+            }
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for s in self.sessions.values():
+                by_status[s.status] = by_status.get(s.status, 0) + 1
+        return {
+            "sessions": by_status,
+            "llm_queue_depth": self.llm.depth(),
+            "llm": dict(self.llm.stats),
+            "embedding_batches": dict(self.batcher.stats),
+        }
+
+
+class IntakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so a station reuses one connection
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    quiet = False
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _dispatch(self, handler):
+        try:
+            self._send(*handler())
+        except KeyError as e:
+            self._send(404, {"error": f"unknown session {e}"})
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+        except queue.Full:
+            self._send(503, {"error": "server busy, retry shortly"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        intake = self.server.intake
+
+        def handle():
+            if parts == ["sessions"]:
+                return 201, intake.start_session(self._read_json())
+            if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "answers":
+                return 200, intake.answer(parts[1], self._read_json().get("answer"))
+            return 404, {"error": "not found"}
+        self._dispatch(handle)
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        intake = self.server.intake
+
+        def handle():
+            if parts == ["stats"]:
+                return 200, intake.stats()
+            if len(parts) == 2 and parts[0] == "sessions":
+                return 200, intake.get(parts[1])
+            return 404, {"error": "not found"}
+        self._dispatch(handle)
+
+
+def make_server(intake, host=DEFAULT_HOST, port=DEFAULT_PORT, quiet=False):
+    """An HTTP server bound to (host, port) serving `intake`; port 0 picks a free port."""
+    handler = type("Handler", (IntakeHandler,), {"quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.intake = intake
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve concurrent intake sessions over HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--llm-workers", type=int, default=LLM_WORKERS)
+    parser.add_argument("--llm-queue-size", type=int, default=LLM_QUEUE_SIZE)
+    parser.add_argument("--no-csv", action="store_true", help="don't write per-patient CSVs, traces or store rows")
+    args = parser.parse_args()
+
+    threading.Thread(target=preload_model, args=(args.model,), daemon=True).start()
+    intake = IntakeServer(model=args.model, llm_workers=args.llm_workers,
+                          llm_queue_size=args.llm_queue_size, save_csv=not args.no_csv)
+    server = make_server(intake, args.host, args.port)
+    print(f"✅ Intake server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import json
+import threading
+import numpy as np
+
+from ivf_index import normalize_rows
+
+# Deterministic pre-filter for inventory selection: how close the patient's
+# self-report is to each inventory's item texts, in the retriever's embedding
+# space. It narrows the list the LLM chooses from, and stands in for the LLM's
+# choice when its reply can't be used, without a second LLM round-trip.
+
+PREFILTER_CANDIDATES = 8        # inventories offered to the LLM, closest first
+TOP_ITEMS = 3                   # an inventory scores the mean similarity of its best-matching items
+FALLBACK_INVENTORIES = 2        # administered when the LLM's reply can't be parsed...
+FALLBACK_MIN_SIMILARITY = 0.2   # ...if they are at least this close to the self-report
+
+
+class InventoryPrefilter:
+    def __init__(self, inventories, encode):
+        """`inventories` maps filename -> inventory JSON; `encode` embeds a list of texts."""
+        self.files = sorted(inventories)
+        texts = []
+        rows = []  # item rows of each inventory
+        for filename in self.files:
+            questions = inventories[filename]["questions"]
+            rows.append(range(len(texts), len(texts) + len(questions)))
+            texts.extend(q["text"] for q in questions)
+        self.item_embeddings = normalize_rows(encode(texts))
+        # (n_inventories, max_items) item row per slot, -1 past an inventory's last item
+        width = max(len(r) for r in rows)
+        self.item_index = np.full((len(rows), width), -1)
+        for i, r in enumerate(rows):
+            self.item_index[i, :len(r)] = list(r)
+
+    def scores(self, query_vec):
+        """Similarity of every inventory in self.files to one query embedding."""
+        query_vec = normalize_rows(np.asarray(query_vec).reshape(-1))
+        sims = self.item_embeddings @ query_vec
+        per_item = np.where(self.item_index >= 0, sims[self.item_index], -np.inf)
+        best = -np.sort(-per_item, axis=1)[:, :TOP_ITEMS]
+        best[np.isinf(best)] = np.nan  # inventories with fewer than TOP_ITEMS items
+        return np.nanmean(best, axis=1)
+
+    def rank(self, query_vec, files=None):
+        """[(filename, similarity)] closest first, restricted to `files` when given."""
+        scores = self.scores(query_vec)
+        allowed = set(files) if files is not None else None
+        ranked = [(f, float(s)) for f, s in zip(self.files, scores) if allowed is None or f in allowed]
+        return sorted(ranked, key=lambda pair: -pair[1])
+
+
+def candidates(ranked, n=PREFILTER_CANDIDATES):
+    return [f for f, _ in ranked[:n]]
+
+
+def fallback(ranked, n=FALLBACK_INVENTORIES, min_similarity=FALLBACK_MIN_SIMILARITY):
+    return [f for f, s in ranked[:n] if s >= min_similarity]
+
+
+_prefilters = {}
+_prefilters_lock = threading.Lock()
+
+
+def load_prefilter(folder, embed_model, encode):
+    """The InventoryPrefilter for every inventory JSON in `folder`, built once per embedding model."""
+    key = (os.path.abspath(folder), embed_model)
+    with _prefilters_lock:
+        if key not in _prefilters:
+            inventories = {}
+            for filename in sorted(os.listdir(folder)):
+                if filename.endswith(".json"):
+                    with open(os.path.join(folder, filename), "r", encoding="utf-8") as f:
+                        inventories[filename] = json.load(f)
+            _prefilters[key] = InventoryPrefilter(inventories, encode)
+        return _prefilters[key]
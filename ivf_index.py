@@ -0,0 +1,127 @@
+import os
+import numpy as np
+
+# Inverted-file (IVF) approximate nearest neighbour index over normalized embeddings.
+# Vectors are clustered with spherical k-means; a query only scores the vectors in
+# its `nprobe` closest clusters instead of the whole matrix.
+
+ASSIGN_BATCH = 8192      # rows per assignment step, bounds memory during build
+TRAIN_PER_LIST = 64      # k-means training sample size per list
+
+
+def default_nlist(n):
+    return max(1, int(2 * np.sqrt(n)))
+
+
+def normalize_rows(x):
+    """Rows scaled to unit length as float32 (zero rows are left as they are)."""
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _assign(vectors, centroids):
+    """Index of the closest centroid for every row, computed in batches."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        block = np.asarray(vectors[start:start + ASSIGN_BATCH], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores along the last axis, best first."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.zeros(scores.shape[:-1] + (0,), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
+
+
+def recall_at_k(approx_ids, exact_ids):
+    """Mean fraction of the exact top-k found by the approximate search."""
+    hits = [len(set(a) & set(e)) / max(1, len(e)) for a, e in zip(approx_ids, exact_ids)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+class IVFIndex:
+    def __init__(self, centroids, list_offsets, list_ids):
+        self.centroids = centroids        # (nlist, dim)
+        self.list_offsets = list_offsets  # (nlist + 1,) start of each list in list_ids
+        self.list_ids = list_ids          # (n,) row ids grouped by list
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, iters=10, seed=0):
+        n = len(embeddings)
+        nlist = min(nlist or default_nlist(n), n)
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, nlist * TRAIN_PER_LIST)
+        sample_ids = np.sort(rng.choice(n, size=sample_size, replace=False))
+        sample = normalize_rows(embeddings[sample_ids])
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        for _ in range(iters):
+            labels = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty lists from random sample rows so no list is wasted
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        labels = _assign(embeddings, centroids)
+        list_ids = np.argsort(labels, kind="stable").astype(np.int64)
+        counts = np.bincount(labels, minlength=nlist)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids.astype(np.float32), list_offsets, list_ids)
+
+    def candidates(self, query, nprobe):
+        """Row ids stored in the `nprobe` lists closest to a single query."""
+        probe = top_k(self.centroids @ query, nprobe)
+        parts = [self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def search(self, embeddings, queries, top_n, nprobe=16, allowed=None, stats=None):
+        """
+        Approximate top_n (ids, scores) for each query row, best first.
+        `allowed` optionally restricts results to a sorted array of row ids;
+        `stats`, if given, accumulates the number of rows scored under "candidates".
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        all_ids = []
+        all_scores = []
+        for q in queries:
+            # Sorted ids keep reads from a memory-mapped matrix sequential
+            cand = np.sort(self.candidates(q, nprobe))
+            if allowed is not None:
+                cand = cand[np.isin(cand, allowed, assume_unique=True)]
+            if stats is not None:
+                stats["candidates"] = stats.get("candidates", 0) + len(cand)
+            scores = np.asarray(embeddings[cand], dtype=np.float32) @ q
+            best = top_k(scores, top_n)
+            all_ids.append(cand[best])
+            all_scores.append(scores[best])
+        return all_ids, all_scores
+
+    def save(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        for name in ("centroids", "list_offsets", "list_ids"):
+            tmp = os.path.join(folder, name + ".tmp.npy")
+            np.save(tmp, getattr(self, name))
+            os.replace(tmp, os.path.join(folder, name + ".npy"))
+
+    @classmethod
+    def load(cls, folder):
+        return cls(
+            np.load(os.path.join(folder, "centroids.npy")),
+            np.load(os.path.join(folder, "list_offsets.npy")),
+            np.load(os.path.join(folder, "list_ids.npy"), mmap_mode="r"),
+        )
@@ -0,0 +1,138 @@
+"""
+Response cache for replayed LLM requests (batch runs, model benchmarks). It is off
+unless a caller opts in with use_cache=True (see USE_CACHE in llm/local_llm.py);
+live sessions always get a fresh reply.
+
+What it stores, in CACHE_PATH: per request a key (a SHA-256 over the model name,
+a SHA-256 of the prompt and the generation options), the model name, the response
+text in plaintext, its size, and when it was created and last used. Prompts are
+not stored, but responses can repeat patient details. Rows expire after
+TTL_SECONDS; LLMCache().clear() or deleting the file removes them all.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_PATH = "output/llm_cache.sqlite3"
+MEMORY_ENTRIES = 256                  # responses kept in the in-process LRU
+MAX_DISK_BYTES = 256 * 1024 * 1024    # oldest-used responses are evicted past this size
+TTL_SECONDS = 30 * 24 * 3600          # None keeps responses forever
+
+
+def cache_key(model, prompt, options=None):
+    """Stable key from the model name, a digest of the prompt and the generation options."""
+    prompt_digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    material = json.dumps({"model": model, "prompt": prompt_digest, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """In-memory LRU in front of a persistent SQLite store of LLM responses."""
+
+    def __init__(self, path=CACHE_PATH, memory_entries=MEMORY_ENTRIES,
+                 max_disk_bytes=MAX_DISK_BYTES, ttl=TTL_SECONDS):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()   # key -> (response, created)
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+            " size INTEGER, created REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def _remember(self, key, response, created):
+        self._memory[key] = (response, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model, prompt, options=None):
+        key = cache_key(model, prompt, options)
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                response, created = self._memory[key]
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+            row = self._db.execute("SELECT response, size, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                response, size, created = row
+                if not self._expired(created, now):
+                    self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, response, created)
+                    self.stats["disk_hits"] += 1
+                    return response
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self._disk_bytes -= size
+                self.stats["evictions"] += 1
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, model, prompt, response, options=None):
+        key = cache_key(model, prompt, options)
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._disk_bytes -= old[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._disk_bytes += size
+            self._evict()
+            self._db.commit()
+            self._remember(key, response, now)
+
+    def _evict(self):
+        """Drop expired rows, then least recently used rows until under max_disk_bytes."""
+        if self.ttl is not None:
+            cutoff = time.time() - self.ttl
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created < ?", (cutoff,)
+            ).fetchone()
+            if count:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+                self._disk_bytes -= size
+                self.stats["evictions"] += count
+        while self._disk_bytes > self.max_disk_bytes:
+            row = self._db.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self._memory.pop(row[0], None)
+            self._disk_bytes -= row[1]
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._memory.clear()
+            self._disk_bytes = 0
@@ -1,20 +1,201 @@
-import subprocess
+import json
+import time
+import queue
+import socket
+import http.client
+import threading
+from urllib.parse import urlparse
 
-OLLAMA_PATH = r"C:\Users\jammy\AppData\Local\Programs\Ollama\ollama.exe"
+import tracing
+from llm.llm_cache import LLMCache
+
+OLLAMA_HOST = "http://localhost:11434"   # started with "ollama serve"
 MODEL_NAME = 'phi'
+KEEP_ALIVE = "30m"        # how long Ollama keeps the model loaded after a request
+REQUEST_TIMEOUT = 600     # seconds without data before a request is abandoned
+POOL_SIZE = 4             # persistent HTTP connections kept open to the server
+USE_CACHE = False         # replay identical (model, prompt, options) requests from llm_cache; opt-in,
+                          # since responses (impressions) are kept on disk in plaintext
+
+# Timing fields of Ollama's final streamed chunk (durations are in nanoseconds)
+_SERVER_STATS = ("total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration",
+                 "eval_count", "eval_duration")
+
+# Errors that mean a pooled keep-alive connection was closed under us
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class OllamaClient:
+    """Talks to the Ollama server API over a small pool of reused HTTP connections."""
+
+    def __init__(self, host=OLLAMA_HOST, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT):
+        url = urlparse(host)
+        self.host = url.hostname or "localhost"
+        self.port = url.port or 11434
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _post(self, path, payload):
+        """POST JSON and return (connection, response); retries once on a stale connection."""
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            conn = self._acquire()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                conn.close()
+                raise
+            if resp.status != 200:
+                detail = resp.read().decode("utf-8", errors="replace")
+                conn.close()
+                raise RuntimeError(f"Ollama returned HTTP {resp.status}: {detail}")
+            return conn, resp
+
+    def stream(self, prompt, model=MODEL_NAME, options=None, keep_alive=KEEP_ALIVE, stats=None, format=None):
+        """
+        Yield generated text pieces as the server produces them.
+        `stats`, if given, is filled with the server's timing fields from the final chunk.
+        `format` is "json" or a JSON schema the server constrains the output to.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": True, "keep_alive": keep_alive}
+        if options:
+            payload["options"] = options
+        if format is not None:
+            payload["format"] = format
+        conn, resp = self._post("/api/generate", payload)
+        finished = False
+        try:
+            for line in iter(resp.readline, b""):
+                if not line.strip():
+                    continue
+                part = json.loads(line)
+                if "error" in part:
+                    raise RuntimeError(part["error"])
+                if part.get("response"):
+                    yield part["response"]
+                if part.get("done"):
+                    if stats is not None:
+                        stats.update({k: part[k] for k in _SERVER_STATS if k in part})
+                    break
+            resp.read()  # drain so the connection can be reused
+            finished = True
+        finally:
+            # A consumer that stops early leaves unread data on the socket
+            if finished:
+                self._release(conn)
+            else:
+                conn.close()
+
+    def generate(self, prompt, model=MODEL_NAME, options=None, keep_alive=KEEP_ALIVE, format=None):
+        return "".join(self.stream(prompt, model=model, options=options, keep_alive=keep_alive, format=format))
+
+    def preload(self, model=MODEL_NAME, keep_alive=KEEP_ALIVE):
+        """Load the model into memory without generating anything."""
+        conn, resp = self._post("/api/generate", {"model": model, "keep_alive": keep_alive, "stream": False})
+        resp.read()
+        self._release(conn)
+
+    def unload(self, model=MODEL_NAME):
+        self.preload(model, keep_alive=0)
+
+
+_client = OllamaClient()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The shared response cache, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def stream_llm(prompt: str, model: str = MODEL_NAME, options=None, use_cache=USE_CACHE, stats=None, format=None):
+    """
+    Generator over the model's output, for showing text as it arrives.
+    `stats`, if given, receives "cache_hit" and the server's timing fields.
+    """
+    # The output format is part of the request, so it is part of the cache key
+    cache_options = options if format is None else dict(options or {}, format=format)
+    if use_cache:
+        cached = get_cache().get(model, prompt, cache_options)
+        if stats is not None:
+            stats["cache_hit"] = cached is not None
+        if cached is not None:
+            yield cached
+            return
+    pieces = []
+    for piece in _client.stream(prompt, model=model, options=options, stats=stats, format=format):
+        pieces.append(piece)
+        yield piece
+    if use_cache:
+        get_cache().put(model, prompt, "".join(pieces), cache_options)
+
+
+def preload_model(model: str = MODEL_NAME, keep_alive=KEEP_ALIVE):
+    _client.preload(model, keep_alive=keep_alive)
+
+
+def _record_llm_stats(attrs, stats):
+    """Span attributes from the server's final-chunk stats (absent on cache hits)."""
+    if stats.get("eval_count") and stats.get("eval_duration"):
+        attrs["output_tokens"] = stats["eval_count"]
+        attrs["tokens_per_s"] = stats["eval_count"] / (stats["eval_duration"] / 1e9)
+    if "prompt_eval_count" in stats:
+        attrs["prompt_tokens"] = stats["prompt_eval_count"]
+    for field in ("load_duration", "prompt_eval_duration", "eval_duration"):
+        if field in stats:
+            attrs[field.replace("duration", "s")] = stats[field] / 1e9
+
 
-def query_llm(prompt: str) -> str:
-    try:
-        result = subprocess.run(
-            [OLLAMA_PATH, 'run', MODEL_NAME],
-            input=prompt.encode('utf-8'),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=10000
-        )
-        output = result.stdout.decode('utf-8')
-        return output.strip()
-    except subprocess.TimeoutExpired:
-        return "The model took too long to respond."
-    except Exception as e:
-        return f"Error during model execution: {e}"
+def query_llm(prompt: str, model: str = MODEL_NAME, options=None, use_cache=USE_CACHE, format=None) -> str:
+    stats = {}
+    with tracing.span("llm", model=model, prompt_chars=len(prompt),
+                      prompt_tokens_est=tracing.estimate_tokens(prompt)) as attrs:
+        tracing.count("llm.calls")
+        tracing.count("llm.prompt_chars", len(prompt))
+        tracing.count("llm.prompt_tokens_est", attrs["prompt_tokens_est"])
+        start = time.perf_counter()
+        pieces = []
+        try:
+            for piece in stream_llm(prompt, model=model, options=options, use_cache=use_cache, stats=stats,
+                                    format=format):
+                if not pieces:
+                    attrs["ttft_s"] = time.perf_counter() - start
+                pieces.append(piece)
+        except socket.timeout:
+            attrs["error"] = "timeout"
+            return "The model took too long to respond."
+        except Exception as e:
+            attrs["error"] = type(e).__name__
+            return f"Error during model execution: {e}"
+        finally:
+            if "cache_hit" in stats:
+                attrs["cache_hit"] = stats["cache_hit"]
+                tracing.count("llm.cache_hits" if stats["cache_hit"] else "llm.cache_misses")
+            _record_llm_stats(attrs, stats)
+        response = "".join(pieces).strip()
+        attrs["response_chars"] = len(response)
+        return response
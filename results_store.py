@@ -0,0 +1,293 @@
+"""
+Append-only, columnar store of intake session results.
+
+Each session is appended as two small zstd-compressed Parquet files under a
+hive-style date/model partitioning:
+    <root>/sessions/date=2025-07-04/model=phi/<session_id>.parquet   one row per session
+    <root>/scores/date=2025-07-04/model=phi/<session_id>.parquet     one row per inventory
+and indexed by patient and inventory in <root>/index.sqlite3, so a patient's
+history or one inventory's scores only touch the files that contain them.
+Cross-session queries read just the columns they need, e.g.
+    ResultsStore().mean_score_by_model("PCL-5")
+
+Usage (from the project root):
+    python -m results_store import output/*.csv          # backfill the per-patient CSVs
+    python -m results_store mean PCL-5                   # mean total score by model
+    python -m results_store export <session_id> out.csv  # back to the per-patient CSV format
+"""
+import os
+import re
+import csv
+import sys
+import uuid
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils import generate_csv_output
+
+STORE_DIR = "output/results_store"
+COMPRESSION = "zstd"
+# generate_output_filename: JS_1990_01_01_phi.csv; CSVs from before the model suffix have none
+CSV_NAME_RE = re.compile(r"^[A-Z]{2}_(?:\d{4}_\d{2}_\d{2}|UNKNOWN_DATE)(?:_(?P<model>.+))?$")
+
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string()), ("model", pa.string())]), flavor="hive")
+
+SESSION_SCHEMA = pa.schema([
+    ("session_id", pa.string()),
+    ("recorded_at", pa.timestamp("s")),
+    ("patient_key", pa.string()),
+    ("first_name", pa.string()),
+    ("last_name", pa.string()),
+    ("dob", pa.string()),
+    ("self_report", pa.string()),
+    ("chosen_inventories", pa.list_(pa.string())),
+    ("skipped_inventories", pa.list_(pa.string())),
+    ("diagnostic_impression", pa.string()),
+    ("timings", pa.map_(pa.string(), pa.float64())),
+    ("context_tokens", pa.map_(pa.string(), pa.int32())),
+])
+
+SCORE_SCHEMA = pa.schema([
+    ("session_id", pa.string()),
+    ("recorded_at", pa.timestamp("s")),
+    ("patient_key", pa.string()),
+    ("position", pa.int16()),            # order administered, PHQ-4 first
+    ("inventory", pa.string()),
+    ("total_score", pa.int32()),
+    ("question_scores", pa.list_(pa.int16())),
+])
+
+
+def patient_key(first_name, last_name, dob):
+    """Stable pseudonymous id for a patient, so the index holds no names."""
+    material = "|".join(s.strip().lower() for s in (first_name, last_name, dob))
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()[:16]
+
+
+class ResultsStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " session_id TEXT, patient_key TEXT, inventory TEXT, date TEXT, model TEXT,"
+            " session_path TEXT, scores_path TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_patient ON entries (patient_key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_inventory ON entries (inventory)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_session ON entries (session_id)")
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def _partition_path(self, table, date, model, session_id):
+        folder = os.path.join(self.root, table, f"date={date}", f"model={quote(model, safe='')}")
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f"{session_id}.parquet")
+
+    def _write(self, table, schema, rows, path):
+        tmp = path + ".tmp"
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), tmp, compression=COMPRESSION)
+        os.replace(tmp, path)
+
+    # ---- writing ----
+    def append_session(self, outcome, self_report=None, session_id=None, recorded_at=None):
+        """
+        Append one run_session() outcome. Returns the session id. Files are written
+        before the index rows, so a crash never leaves an index entry without data.
+        """
+        session_id = session_id or uuid.uuid4().hex
+        recorded_at = (recorded_at or datetime.datetime.now()).replace(microsecond=0)
+        date = recorded_at.strftime("%Y-%m-%d")
+        model = outcome["model"]
+        first_name, last_name, dob = outcome["patient_info"]
+        key = patient_key(first_name, last_name, dob)
+
+        session_path = self._partition_path("sessions", date, model, session_id)
+        scores_path = self._partition_path("scores", date, model, session_id)
+        self._write("sessions", SESSION_SCHEMA, [{
+            "session_id": session_id,
+            "recorded_at": recorded_at,
+            "patient_key": key,
+            "first_name": first_name,
+            "last_name": last_name,
+            "dob": dob,
+            "self_report": self_report if self_report is not None else outcome.get("self_report"),
+            "chosen_inventories": outcome.get("chosen_inventories", []),
+            "skipped_inventories": outcome.get("skipped_inventories", []),
+            "diagnostic_impression": outcome.get("diagnostic_impression"),
+            "timings": list(outcome.get("timings", {}).items()),
+            "context_tokens": list(outcome.get("context_tokens", {}).items()),
+        }], session_path)
+        self._write("scores", SCORE_SCHEMA, [{
+            "session_id": session_id,
+            "recorded_at": recorded_at,
+            "patient_key": key,
+            "position": position,
+            "inventory": r["name"],
+            "total_score": r["total_score"],
+            "question_scores": r["question_scores"],
+        } for position, r in enumerate(outcome["results"])], scores_path)
+
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(session_id, key, r["name"], date, model, session_path, scores_path) for r in outcome["results"]],
+            )
+            self._db.commit()
+        return session_id
+
+    def update_session(self, session_id, **fields):
+        """
+        Replace fields of an appended session's row, e.g. the diagnostic impression and
+        timings once they are known; the scores and the index are left as they are.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT session_path FROM entries WHERE session_id = ? LIMIT 1",
+                                   (session_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"no session {session_id} in {self.root}")
+        session_path = row[0]
+        record = pq.read_table(session_path, schema=SESSION_SCHEMA).to_pylist()[0]
+        for field, value in fields.items():
+            record[field] = list(value.items()) if isinstance(value, dict) else value
+        self._write("sessions", SESSION_SCHEMA, [record], session_path)
+
+    # ---- reading ----
+    def _indexed_paths(self, column, patient=None, inventory=None, model=None, session_id=None):
+        clauses = []
+        params = []
+        for field, value in (("patient_key", patient), ("inventory", inventory),
+                             ("model", model), ("session_id", session_id)):
+            if value is not None:
+                clauses.append(f"{field} = ?")
+                params.append(value)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._lock:
+            rows = self._db.execute(f"SELECT DISTINCT {column} FROM entries{where}", params).fetchall()
+        return sorted(path for (path,) in rows if os.path.exists(path))
+
+    def _read(self, table, path_column, columns, filter_expr, **lookup):
+        """Read `columns` of the files the index points at (all of the table without a lookup)."""
+        base = os.path.join(self.root, table)
+        if any(v is not None for v in lookup.values()):
+            paths = self._indexed_paths(path_column, **lookup)
+        else:
+            paths = sorted(
+                os.path.join(folder, name)
+                for folder, _, names in os.walk(base) for name in names if name.endswith(".parquet")
+            )
+        schema = SESSION_SCHEMA if table == "sessions" else SCORE_SCHEMA
+        if not paths:
+            empty = pa.schema(list(schema) + [pa.field("date", pa.string()), pa.field("model", pa.string())])
+            return empty.empty_table().select(columns or empty.names).to_pandas()
+        dataset = ds.dataset(paths, format="parquet", partitioning=PARTITIONING, partition_base_dir=base)
+        return dataset.to_table(columns=columns, filter=filter_expr).to_pandas()
+
+    def scores(self, columns=None, inventory=None, patient=None, model=None, session_id=None):
+        """
+        Inventory scores as a DataFrame, one row per administered inventory.
+        `patient` is a patient_key(); filters go through the index first.
+        """
+        filter_expr = None
+        if inventory is not None:
+            filter_expr = pc.field("inventory") == inventory
+        return self._read("scores", "scores_path", columns, filter_expr, patient=patient,
+                          inventory=inventory, model=model, session_id=session_id)
+
+    def sessions(self, columns=None, patient=None, model=None, session_id=None):
+        """Session-level rows (patient, report, impression, timings) as a DataFrame."""
+        return self._read("sessions", "session_path", columns, None, patient=patient,
+                          model=model, session_id=session_id)
+
+    def mean_score_by_model(self, inventory):
+        scores = self.scores(columns=["model", "total_score"], inventory=inventory)
+        return scores.groupby("model")["total_score"].agg(["mean", "count"]).reset_index()
+
+    def export_csv(self, session_id, filename):
+        """Write one session in the per-patient CSV format of generate_csv_output."""
+        session = self.sessions(session_id=session_id)
+        if session.empty:
+            raise KeyError(f"no session {session_id} in {self.root}")
+        row = session.iloc[0]
+        scores = self.scores(columns=["position", "inventory", "total_score", "question_scores"],
+                             session_id=session_id).sort_values("position")
+        results = [
+            {"name": s.inventory, "total_score": int(s.total_score), "question_scores": [int(v) for v in s.question_scores]}
+            for s in scores.itertuples()
+        ]
+        generate_csv_output((row.first_name, row.last_name, row.dob), row.self_report,
+                            row.diagnostic_impression, results, filename)
+
+    def import_csv(self, path, model=None):
+        """
+        Backfill one per-patient CSV written by generate_csv_output. The model comes
+        from the filename suffix (JS_1990_01_01_phi.csv, else "unknown") and the date
+        from the file time.
+        """
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            rows = [r for r in csv.reader(f) if r]
+        name, dob, self_report, impression = (rows[0] + [""] * 4)[:4]
+        first_name, _, last_name = name.partition(" ")
+        results = [
+            {"name": r[0], "total_score": int(float(r[1])),
+             "question_scores": [int(float(v)) for v in r[2:] if v != ""]}
+            for r in rows[2:]
+        ]
+        match = CSV_NAME_RE.match(os.path.splitext(os.path.basename(path))[0])
+        outcome = {
+            "patient_info": (first_name, last_name, dob),
+            "model": model or (match and match.group("model")) or "unknown",
+            "results": results,
+            "diagnostic_impression": impression,
+        }
+        recorded_at = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+        return self.append_session(outcome, self_report, recorded_at=recorded_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and maintain the session results store.")
+    parser.add_argument("--root", default=STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="append per-patient CSVs to the store")
+    imp.add_argument("csvs", nargs="+")
+    mean = sub.add_parser("mean", help="mean total score of an inventory by model")
+    mean.add_argument("inventory")
+    exp = sub.add_parser("export", help="write one session in the per-patient CSV format")
+    exp.add_argument("session_id")
+    exp.add_argument("filename")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.root)
+    try:
+        if args.command == "import":
+            imported = 0
+            for path in args.csvs:
+                try:
+                    store.import_csv(path)
+                    imported += 1
+                except (OSError, ValueError, IndexError) as e:
+                    print(f"❌ Could not import {path}: {e}", file=sys.stderr)
+            print(f"✅ Imported {imported}/{len(args.csvs)} files into {args.root}")
+        elif args.command == "mean":
+            print(store.mean_score_by_model(args.inventory).to_string(index=False))
+        elif args.command == "export":
+            store.export_csv(args.session_id, args.filename)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
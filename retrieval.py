@@ -1,55 +1,519 @@
 import os
 import json
+import hashlib
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+import tracing
+from bm25_index import BM25Index
+from context_packing import MMR_LAMBDA, pack_context
+from dedup import MAX_DISTANCE, Deduplicator, cluster_counts, deduplicate
+from ivf_index import IVFIndex, top_k
 
 # Choose a small, efficient model (see SBERT docs for alternatives)
 EMBED_MODEL = "all-MiniLM-L6-v2"
 
+# Persisted embedding index (one subfolder per embed model)
+INDEX_DIR = "Data/index_cache"
+INDEX_DTYPE = "float32"   # "float16" halves the index on disk and in memory
+
+# Index build / search scaling
+ENCODE_BATCH_SIZE = 64
+ENCODE_PROCESSES = min(4, os.cpu_count() or 1)   # worker processes for large (re)builds
+MULTIPROCESS_MIN_TEXTS = 5000   # below this a process pool costs more than it saves
+ANN_MIN_CHUNKS = 5000           # smaller corpora are searched exactly
+IVF_NPROBE = 16                 # clusters scanned per query; higher = better recall, slower
+INDEX_FORMAT = 5                # bump when the cached index layout changes
+
+# Duplicate chunks are collapsed before embedding (see dedup.py); each kept chunk's
+# metadata carries "dup_count", the number of chunks it stands for
+DEDUP_MAX_DISTANCE = MAX_DISTANCE   # 0 = exact duplicates only, None = keep every chunk
+
+# Hybrid retrieval: BM25 picks candidates, dense embeddings re-rank only those
+RETRIEVAL_MODE = "hybrid"       # or "dense" for pure embedding search
+LEXICAL_CANDIDATES = 200        # BM25 candidates re-ranked per query
+HYBRID_ALPHA = 0.7              # weight of the dense score in the fused score
+
+# Context packing: MMR picks from this many candidates to fill a token budget
+CONTEXT_CANDIDATES = 24
+
+# Metadata fields with a prebuilt partition (row ids per value) for filtered retrieval
+PARTITION_FIELDS = ("source", "disorder")
+# Disorder for dataset files whose rows don't carry a "disorder" field
+FILE_DISORDERS = {
+    "daic_woz_chunks.jsonl": "depression",
+    "ocd_chunks.jsonl": "ocd",
+    "ptsd_chunks.jsonl": "ptsd",
+}
+
+
+def file_hash(path):
+    """Content hash of a file, read in blocks so large JSONL files stay cheap."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _write_npy(path, arr):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+def read_jsonl_chunks(path):
+    """Return (texts, line_numbers, metadata) for every usable chunk in a JSONL file."""
+    texts = []
+    lines = []
+    metas = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for ix, line in enumerate(f):
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            text = obj.get("text") or obj.get("body") or ""
+            if text and isinstance(text, str) and text.strip():
+                texts.append(text.strip())
+                lines.append(ix)
+                metas.append({
+                    k: v for k, v in obj.items()
+                    if k not in ("text", "body") and isinstance(v, (str, int, float, bool))
+                })
+    return texts, lines, metas
+
+
+def chunk_metadata(folder, filename, meta):
+    """Per-chunk metadata with the fields every chunk has: source, file and disorder."""
+    folder_key = os.path.basename(os.path.normpath(folder))
+    meta = dict(meta)
+    meta["source"] = folder_key[:-len("_chunks")] if folder_key.endswith("_chunks") else folder_key
+    meta["file"] = filename
+    meta.setdefault("disorder", FILE_DISORDERS.get(filename, os.path.splitext(filename)[0]))
+    return meta
+
+
 class SemanticRetriever:
-    def __init__(self, folders, max_chunks=300, embed_model=EMBED_MODEL):
+    def __init__(self, folders, max_chunks=None, embed_model=EMBED_MODEL,
+                 index_dir=INDEX_DIR, dtype=INDEX_DTYPE, encode_processes=ENCODE_PROCESSES,
+                 ann_min_chunks=ANN_MIN_CHUNKS, nprobe=IVF_NPROBE, model=None, mode=RETRIEVAL_MODE,
+                 dedup=DEDUP_MAX_DISTANCE):
         self.folders = folders  # list of folders with JSONL files
-        self.model = SentenceTransformer(embed_model)
+        self.embed_model = embed_model
+        self.index_dir = index_dir  # None disables the on-disk index
+        self.dtype = np.dtype(dtype)
+        self.encode_processes = encode_processes
+        self.ann_min_chunks = ann_min_chunks
+        self.nprobe = nprobe
+        self.mode = mode
+        self.dedup = dedup
+        self._model = model  # an already loaded SentenceTransformer can be shared
         self.chunks = []
         self.chunk_sources = []  # List of (file, index)
+        self.chunk_meta = []  # List of metadata dicts (source, file, disorder, ...)
+        self.partitions = {}  # field -> {value: row ids}
         self.embeddings = None
+        self.ivf = None  # IVFIndex once the corpus reaches ann_min_chunks
+        self.bm25 = None  # BM25Index over the chunk texts
+        self.query_encoder = None  # optional callable(list of str) -> embeddings, e.g. a micro-batcher
         self._index_chunks(max_chunks)
 
-    def _index_chunks(self, max_chunks):
-        all_chunks = []
-        sources = []
+    @property
+    def model(self):
+        # Loaded on first use so a warm index never pays for the model import
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.embed_model)
+        return self._model
+
+    def _encode(self, texts):
+        if not texts:
+            dim = self.model.get_sentence_embedding_dimension()
+            return np.zeros((0, dim), dtype=self.dtype)
+        if self.encode_processes > 1 and len(texts) >= MULTIPROCESS_MIN_TEXTS:
+            pool = self.model.start_multi_process_pool(["cpu"] * self.encode_processes)
+            try:
+                emb = self.model.encode_multi_process(texts, pool, batch_size=ENCODE_BATCH_SIZE)
+            finally:
+                self.model.stop_multi_process_pool(pool)
+        else:
+            emb = self.model.encode(texts, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False)
+        return np.asarray(emb, dtype=self.dtype)
+
+    def _jsonl_files(self):
         for folder in self.folders:
             for filename in sorted(os.listdir(folder)):
                 if filename.endswith('.jsonl'):
-                    path = os.path.join(folder, filename)
-                    with open(path, 'r', encoding='utf-8') as f:
-                        for ix, line in enumerate(f):
-                            obj = json.loads(line)
-                            text = obj.get("text") or obj.get("body") or ""
-                            text = text.strip()
-                            if text:
-                                all_chunks.append(text)
-                                sources.append((filename, ix))
-                                if len(all_chunks) >= max_chunks:
-                                    break
-                if len(all_chunks) >= max_chunks:
-                    break
-            if len(all_chunks) >= max_chunks:
+                    yield folder, filename
+
+    def _model_dir(self):
+        slug = self.embed_model.replace("/", "__")
+        return os.path.join(self.index_dir, f"{slug}-{self.dtype.name}")
+
+    def _index_chunks(self, max_chunks):
+        if self.index_dir is None:
+            self._build_in_memory(max_chunks)
+            return
+
+        model_dir = self._model_dir()
+        shard_dir = os.path.join(model_dir, "shards")
+        os.makedirs(shard_dir, exist_ok=True)
+
+        files = [
+            {"folder": folder, "filename": filename,
+             "hash": file_hash(os.path.join(folder, filename))}
+            for folder, filename in self._jsonl_files()
+        ]
+        manifest = {
+            "embed_model": self.embed_model,
+            "dtype": self.dtype.name,
+            "max_chunks": max_chunks,
+            "dedup": self.dedup,
+            "format": INDEX_FORMAT,
+            "files": files,
+        }
+        manifest_path = os.path.join(model_dir, "manifest.json")
+        emb_path = os.path.join(model_dir, "embeddings.npy")
+        chunks_path = os.path.join(model_dir, "chunks.json")
+        ivf_dir = os.path.join(model_dir, "ivf")
+        bm25_dir = os.path.join(model_dir, "bm25")
+
+        # ---- fast path: nothing changed, memory-map the combined matrix ----
+        if os.path.exists(manifest_path) and os.path.exists(emb_path) and os.path.exists(chunks_path):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if cached == manifest:
+                    with open(chunks_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    self.chunks = meta["chunks"]
+                    self.chunk_sources = [tuple(s) for s in meta["sources"]]
+                    self.chunk_meta = meta["meta"]
+                    self.embeddings = np.load(emb_path, mmap_mode="r")
+                    self._build_partitions()
+                    self._load_or_build_ivf(ivf_dir)
+                    self.bm25 = BM25Index.load(bm25_dir)
+                    tracing.count("retrieval.index_cache_hits")
+                    return
+            except (OSError, ValueError, KeyError):
+                pass  # corrupt, partial or older cache, rebuild below
+
+        # ---- incremental rebuild: re-encode only files whose hash changed ----
+        # One Deduplicator runs over the whole corpus in file order before anything is
+        # encoded, so a chunk duplicating one in an earlier file is never embedded
+        tracing.count("retrieval.index_rebuilds")
+        dedup = Deduplicator(self.dedup) if self.dedup is not None else None
+        reps = []  # representative of every chunk read, as an index into the corpus
+        all_chunks = []
+        sources = []
+        metas = []
+        matrices = []
+        shards = set()
+        for entry in files:
+            remaining = None if max_chunks is None else max_chunks - len(reps)
+            if remaining is not None and remaining <= 0:
                 break
+            texts, lines, file_metas = read_jsonl_chunks(os.path.join(entry["folder"], entry["filename"]))
+            take = len(texts) if remaining is None else min(len(texts), remaining)
+            first = len(reps)
+            reps.extend(range(first, first + take) if dedup is None else (dedup.add(t) for t in texts[:take]))
+            rows = [i for i in range(take) if reps[first + i] == first + i]
+            if not rows:
+                continue  # every chunk duplicates an earlier file, e.g. a renamed copy
+            stem, emb = self._load_or_encode_shard(shard_dir, entry, texts, rows)
+            shards.update((stem + ".npy", stem + ".rows.npy"))
+            all_chunks.extend(texts[i] for i in rows)
+            sources.extend((entry["filename"], lines[i]) for i in rows)
+            metas.extend(chunk_metadata(entry["folder"], entry["filename"], file_metas[i]) for i in rows)
+            matrices.append(emb)
+
+        # Drop shards of files that changed or left the corpus
+        for name in os.listdir(shard_dir):
+            if name.endswith(".npy") and name not in shards:
+                os.remove(os.path.join(shard_dir, name))
+
+        if matrices:
+            embeddings = np.concatenate(matrices).astype(self.dtype, copy=False)
+        else:
+            embeddings = self._encode([])
+        if dedup is not None:
+            _, counts = cluster_counts(np.asarray(reps, dtype=np.int64))
+            tracing.count("retrieval.duplicate_chunks", len(reps) - len(all_chunks))
+            for meta, count in zip(metas, counts):
+                meta["dup_count"] = int(count)
+
+        # Invalidate the old manifest first so a crash mid-write forces a rebuild
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        _write_npy(emb_path, embeddings)
+        _write_json(chunks_path, {"chunks": all_chunks, "sources": sources, "meta": metas})
         self.chunks = all_chunks
         self.chunk_sources = sources
-        self.embeddings = self.model.encode(self.chunks, show_progress_bar=False)
-
-    def retrieve(self, query, top_n=4, max_total_chars=4000):
-        q_emb = self.model.encode([query])[0]
-        sims = np.inner(self.embeddings, q_emb)
-        top_ids = np.argsort(sims)[::-1][:top_n]
-        results = []
-        chars = 0
-        for idx in top_ids:
-            chunk = self.chunks[idx]
-            if chars + len(chunk) > max_total_chars:
-                break
-            results.append(chunk)
-            chars += len(chunk)
-        return results
+        self.chunk_meta = metas
+        self.embeddings = np.load(emb_path, mmap_mode="r")
+        self._build_partitions()
+        self._load_or_build_ivf(ivf_dir, rebuild=True)
+        self.bm25 = BM25Index.build(all_chunks)
+        self.bm25.save(bm25_dir)
+        _write_json(manifest_path, manifest)
+
+    def _load_or_build_ivf(self, ivf_dir, rebuild=False):
+        if len(self.chunks) < self.ann_min_chunks:
+            self.ivf = None
+            return
+        if not rebuild and os.path.exists(os.path.join(ivf_dir, "list_ids.npy")):
+            try:
+                self.ivf = IVFIndex.load(ivf_dir)
+                if self.ivf.list_offsets[-1] == len(self.chunks):
+                    return
+            except (OSError, ValueError):
+                pass
+        self.ivf = IVFIndex.build(self.embeddings)
+        self.ivf.save(ivf_dir)
+
+    def _collapse(self, texts):
+        """(kept row indices, chunks each stands for) under the dedup setting."""
+        if self.dedup is None:
+            return np.arange(len(texts)), np.ones(len(texts), dtype=np.int64)
+        kept, counts = cluster_counts(deduplicate(texts, self.dedup))
+        tracing.count("retrieval.duplicate_chunks", len(texts) - len(kept))
+        return kept, counts
+
+    def _load_or_encode_shard(self, shard_dir, entry, texts, rows):
+        """
+        (shard stem, embeddings) of a file's kept `rows`. Shards are keyed by content hash
+        alone, so a renamed file keeps its shard, and record which rows they hold, so only
+        rows the shard lacks are encoded when dedup keeps a different set of the file's chunks.
+        """
+        stem = f"{entry['hash'][:16]}.dedup-{self.dedup}"
+        emb_path = os.path.join(shard_dir, stem + ".npy")
+        rows_path = os.path.join(shard_dir, stem + ".rows.npy")
+
+        cached = {}  # file row -> embedding
+        if os.path.exists(emb_path) and os.path.exists(rows_path):
+            try:
+                cached_emb, cached_rows = np.load(emb_path), np.load(rows_path)
+                if len(cached_emb) == len(cached_rows):
+                    cached = dict(zip(cached_rows.tolist(), cached_emb))
+            except (OSError, ValueError):
+                cached = {}
+        missing = [r for r in rows if r not in cached]
+        if not missing:
+            tracing.count("retrieval.shard_cache_hits")
+            return stem, np.stack([cached[r] for r in rows])
+
+        tracing.count("retrieval.encoded_chunks", len(missing))
+        cached.update(zip(missing, self._encode([texts[r] for r in missing])))
+        emb = np.stack([cached[r] for r in rows])
+        # Rows go last: a crash between the two writes leaves no rows file, not mismatched ones
+        if os.path.exists(rows_path):
+            os.remove(rows_path)
+        _write_npy(emb_path, emb)
+        _write_npy(rows_path, np.asarray(rows, dtype=np.int64))
+        return stem, emb
+
+    def _build_in_memory(self, max_chunks):
+        all_chunks = []
+        sources = []
+        metas = []
+        for folder, filename in self._jsonl_files():
+            texts, lines, file_metas = read_jsonl_chunks(os.path.join(folder, filename))
+            for text, ix, meta in zip(texts, lines, file_metas):
+                if max_chunks is not None and len(all_chunks) >= max_chunks:
+                    break
+                all_chunks.append(text)
+                sources.append((filename, ix))
+                metas.append(chunk_metadata(folder, filename, meta))
+        kept, counts = self._collapse(all_chunks)
+        if self.dedup is not None:
+            for i, count in zip(kept, counts):
+                metas[i]["dup_count"] = int(count)
+        self._set_corpus([all_chunks[i] for i in kept], [sources[i] for i in kept], [metas[i] for i in kept])
+
+    def _set_corpus(self, chunks, sources, metas, embeddings=None):
+        self.chunks = chunks
+        self.chunk_sources = sources
+        self.chunk_meta = metas
+        self.embeddings = self._encode(chunks) if embeddings is None else embeddings
+        self.ivf = IVFIndex.build(self.embeddings) if chunks and len(chunks) >= self.ann_min_chunks else None
+        self.bm25 = BM25Index.build(chunks)
+        self._build_partitions()
+
+    @classmethod
+    def from_texts(cls, texts, sources=None, embeddings=None, metas=None, **kwargs):
+        """In-memory retriever over the given chunk texts (benchmarks and experiments)."""
+        retriever = cls([], index_dir=None, **kwargs)
+        sources = sources if sources is not None else [("<memory>", ix) for ix in range(len(texts))]
+        metas = metas if metas is not None else [{} for _ in texts]
+        retriever._set_corpus(list(texts), sources, metas, embeddings)
+        return retriever
+
+    # ---- metadata partitions ----
+    def _build_partitions(self):
+        self.partitions = {}
+        for field in PARTITION_FIELDS:
+            self._partition(field)
+
+    def _partition(self, field):
+        """{value: sorted row ids} for a metadata field, built on first use."""
+        if field not in self.partitions:
+            groups = {}
+            for ix, meta in enumerate(self.chunk_meta):
+                if field in meta:
+                    groups.setdefault(meta[field], []).append(ix)
+            self.partitions[field] = {value: np.asarray(ids, dtype=np.int64) for value, ids in groups.items()}
+        return self.partitions[field]
+
+    def filter_ids(self, filters):
+        """
+        Row ids matching every filter, e.g. {"source": "dsm5", "disorder": {"ocd", "ptsd"}}.
+        A set/list/tuple value matches any of its members. None means no filtering.
+        """
+        if not filters:
+            return None
+        ids = None
+        for field, wanted in filters.items():
+            values = wanted if isinstance(wanted, (set, frozenset, list, tuple)) else [wanted]
+            partition = self._partition(field)
+            parts = [partition[v] for v in values if v in partition]
+            matched = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+            ids = matched if ids is None else np.intersect1d(ids, matched, assume_unique=True)
+        return ids
+
+    def _dense_search(self, q_embs, top_n, allowed, stats):
+        """Per-query (ids, scores) by embedding similarity, restricted to `allowed` rows."""
+        if allowed is not None and (self.ivf is None or len(allowed) <= self.ann_min_chunks):
+            # A small partition is cheaper to scan exactly than to probe through the IVF lists
+            stats["candidates"] = stats.get("candidates", 0) + len(allowed) * len(q_embs)
+            sims = q_embs @ np.asarray(self.embeddings[allowed], dtype=np.float32).T
+            best = top_k(sims, top_n)
+            return list(allowed[best]), list(np.take_along_axis(sims, best, axis=1))
+        if self.ivf is not None:
+            return self.ivf.search(self.embeddings, q_embs, top_n, nprobe=self.nprobe, allowed=allowed, stats=stats)
+        stats["candidates"] = stats.get("candidates", 0) + len(self.chunks) * len(q_embs)
+        sims = q_embs @ np.asarray(self.embeddings, dtype=np.float32).T
+        best = top_k(sims, top_n)
+        return list(best), list(np.take_along_axis(sims, best, axis=1))
+
+    def _hybrid_search(self, query, q_emb, top_n, allowed, stats):
+        """
+        BM25 top candidates re-ranked with dense similarity; both scores are min-max
+        normalized over the candidates and fused with HYBRID_ALPHA. Returns None when
+        the query has too few lexical matches, so the caller falls back to dense search.
+        """
+        lexical = self.bm25.scores(query)
+        if allowed is not None:
+            lexical_allowed = lexical[allowed]
+            best = top_k(lexical_allowed, LEXICAL_CANDIDATES)
+            cand = allowed[best]
+            lex = lexical_allowed[best]
+        else:
+            cand = top_k(lexical, LEXICAL_CANDIDATES)
+            lex = lexical[cand]
+        keep = lex > 0
+        cand, lex = cand[keep], lex[keep]
+        if len(cand) < top_n:
+            return None
+
+        stats["candidates"] = stats.get("candidates", 0) + len(cand)
+        order = np.argsort(cand)  # sequential reads from the memory-mapped matrix
+        cand, lex = cand[order], lex[order]
+        dense = np.asarray(self.embeddings[cand], dtype=np.float32) @ q_emb
+
+        def _minmax(x):
+            span = x.max() - x.min()
+            return (x - x.min()) / span if span > 0 else np.ones_like(x)
+
+        fused = HYBRID_ALPHA * _minmax(dense) + (1 - HYBRID_ALPHA) * _minmax(lex)
+        best = top_k(fused, top_n)
+        return cand[best], fused[best]
+
+    def warm_up(self):
+        """Load the embedding model and run one throwaway query, so the first real query is fast."""
+        with tracing.span("retrieve.warm_up"):
+            self.encode_queries(["warm up"])
+
+    def encode_queries(self, queries):
+        with tracing.span("retrieve.encode", queries=len(queries)):
+            encode = self.query_encoder or (lambda texts: self.model.encode(texts, show_progress_bar=False))
+            return np.asarray(encode(list(queries)), dtype=np.float32)
+
+    def retrieve_many(self, queries, top_n=4, max_total_chars=None, filters=None, mode=None,
+                      query_embeddings=None):
+        """
+        Retrieve for several queries in one pass: one encode call, one similarity
+        matrix and a partial top-k per query. Returns one list per query of
+        {"id", "text", "score", "source", "meta"} dicts, best first, optionally cut to a
+        char budget. `filters` restricts the search to matching partitions (see filter_ids);
+        `mode` overrides the retriever's "hybrid"/"dense" setting.
+        """
+        queries = list(queries)
+        mode = mode or self.mode
+        with tracing.span("retrieve", queries=len(queries), top_n=top_n, filtered=bool(filters)) as attrs:
+            q_embs = self.encode_queries(queries) if query_embeddings is None else query_embeddings
+            allowed = self.filter_ids(filters)
+
+            stats = {}
+            ids_per_query = [None] * len(queries)
+            scores_per_query = [None] * len(queries)
+            with tracing.span("retrieve.search", mode=mode):
+                if mode == "hybrid" and self.bm25 is not None:
+                    for qi, (query, q_emb) in enumerate(zip(queries, q_embs)):
+                        hit = self._hybrid_search(query, q_emb, top_n, allowed, stats)
+                        if hit is not None:
+                            ids_per_query[qi], scores_per_query[qi] = hit
+                dense_rows = [qi for qi in range(len(queries)) if ids_per_query[qi] is None]
+                if dense_rows:
+                    ids, scores = self._dense_search(q_embs[dense_rows], top_n, allowed, stats)
+                    for qi, row_ids, row_scores in zip(dense_rows, ids, scores):
+                        ids_per_query[qi], scores_per_query[qi] = row_ids, row_scores
+            attrs["candidates"] = stats.get("candidates", 0)
+            attrs["dense_fallbacks"] = len(dense_rows) if mode == "hybrid" else 0
+            tracing.count("retrieval.queries", len(queries))
+            tracing.count("retrieval.candidates", attrs["candidates"])
+
+            all_results = []
+            for ids, scores in zip(ids_per_query, scores_per_query):
+                results = []
+                chars = 0
+                for idx, score in zip(ids, scores):
+                    chunk = self.chunks[idx]
+                    if max_total_chars is not None and chars + len(chunk) > max_total_chars:
+                        break
+                    results.append({
+                        "id": int(idx),
+                        "text": chunk,
+                        "score": float(score),
+                        "source": self.chunk_sources[idx],
+                        "meta": self.chunk_meta[idx],
+                    })
+                    chars += len(chunk)
+                all_results.append(results)
+            attrs["results"] = sum(len(r) for r in all_results)
+            return all_results
+
+    def retrieve_context(self, query, token_budget, top_n=4, filters=None,
+                         candidates=CONTEXT_CANDIDATES, lambda_=MMR_LAMBDA, query_embeddings=None):
+        """
+        Prompt-ready context for one query: up to top_n chunks chosen by MMR from the
+        best `candidates`, packed into `token_budget` tokens. Returns (text, chunks, tokens).
+        `query_embeddings` (one row, from encode_queries) skips encoding the query again.
+        """
+        q_emb = self.encode_queries([query]) if query_embeddings is None else query_embeddings
+        results = self.retrieve_many([query], top_n=max(top_n, candidates), filters=filters,
+                                     query_embeddings=q_emb)[0]
+        with tracing.span("retrieve.pack", candidates=len(results), token_budget=token_budget) as attrs:
+            vectors = np.asarray(self.embeddings[[r["id"] for r in results]], dtype=np.float32)
+            text, packed, tokens = pack_context(results, vectors, token_budget, max_chunks=top_n, lambda_=lambda_)
+            attrs.update(chunks=len(packed), tokens=tokens, trimmed=sum("full_text" in r for r in packed))
+        return text, packed, tokens
+
+    def retrieve(self, query, top_n=4, max_total_chars=4000, filters=None):
+        return [r["text"] for r in self.retrieve_many([query], top_n, max_total_chars, filters)[0]]
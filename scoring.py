@@ -0,0 +1,199 @@
+"""
+Vectorized inventory scoring driven by each inventory's JSON.
+
+compile_scoring() turns an inventory's options and optional `scoring` block into
+arrays once; CompiledScoring then scores any number of response vectors in a
+handful of NumPy operations. Supported `scoring` keys (all optional):
+    total_range      [min, max] of the total; compiling raises if the items can score outside it
+    interpretation   [{"min", "max", "label"}] bands over the total
+    cutoff           totals >= cutoff screen positive
+    cutoff_subscale  apply the cutoff to this subscale instead of the total (MDQ: symptom count)
+    screen_items     [{"id", "min"}] items that must also reach "min" for a positive screen
+    max_of           [[item ids]] groups that contribute their highest item once (QIDS-SR-16)
+    subscales        {"name": [item ids]} summed over item scores
+    reverse_keyed    [item ids] scored as (item min + item max - value)
+Without a scoring block the total is the plain item sum, as before.
+
+Usage (from the project root), re-scoring everything in the results store:
+    python -m scoring output/results_store
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+
+INVENTORIES_DIR = "inventories"
+
+
+class CompiledScoring:
+    def __init__(self, inventory):
+        questions = inventory["questions"]
+        scoring = inventory.get("scoring", {})
+        self.title = inventory["title"]
+        self.n_items = len(questions)
+        self.item_ids = [q["id"] for q in questions]
+        col = {qid: i for i, qid in enumerate(self.item_ids)}
+
+        # (n_items, max_options) option index -> item value, NaN past each item's options
+        width = max(len(q["options"]) for q in questions)
+        self.option_values = np.full((self.n_items, width), np.nan)
+        for i, q in enumerate(questions):
+            self.option_values[i, :len(q["options"])] = [o["value"] for o in q["options"]]
+        self.n_options = np.array([len(q["options"]) for q in questions])
+
+        # Reverse keying as an affine map per item: value * sign + offset
+        self.sign = np.ones(self.n_items)
+        self.offset = np.zeros(self.n_items)
+        for qid in scoring.get("reverse_keyed", []):
+            i = col[qid]
+            self.sign[i] = -1
+            self.offset[i] = np.nanmin(self.option_values[i]) + np.nanmax(self.option_values[i])
+
+        # Total = sum over groups of the group max; ungrouped items are groups of one.
+        # Groups are padded by repeating their first item, which leaves the max unchanged.
+        grouped = [[col[qid] for qid in group] for group in scoring.get("max_of", [])]
+        in_group = {i for group in grouped for i in group}
+        groups = grouped + [[i] for i in range(self.n_items) if i not in in_group]
+        group_width = max(len(g) for g in groups)
+        self.group_index = np.array([g + [g[0]] * (group_width - len(g)) for g in groups])
+
+        subscales = scoring.get("subscales", {})
+        self.subscale_names = list(subscales)
+        self.subscale_weights = np.zeros((self.n_items, len(subscales)))
+        for j, items in enumerate(subscales.values()):
+            self.subscale_weights[[col[qid] for qid in items], j] = 1
+
+        bands = sorted(scoring.get("interpretation", []), key=lambda b: b["min"])
+        self.band_min = np.array([b["min"] for b in bands], dtype=float)
+        self.band_max = np.array([b["max"] for b in bands], dtype=float)
+        self.band_labels = np.array([b["label"] for b in bands] + [None], dtype=object)
+        self.total_range = scoring.get("total_range")
+        self.cutoff = scoring.get("cutoff")
+        cutoff_subscale = scoring.get("cutoff_subscale")
+        self.cutoff_column = None if cutoff_subscale is None else self.subscale_names.index(cutoff_subscale)
+        self.screen_items = [(col[item["id"]], item["min"]) for item in scoring.get("screen_items", [])]
+        if self.total_range is not None:
+            # Reverse keying maps each item's range onto itself, so the extremes are every
+            # item at its lowest and every item at its highest value
+            item_range = np.stack([np.nanmin(self.option_values, axis=1), np.nanmax(self.option_values, axis=1)])
+            lowest, highest = item_range[:, self.group_index].max(axis=2).sum(axis=1)
+            if lowest < self.total_range[0] or highest > self.total_range[1]:
+                raise ValueError(f"{self.title}: items score {lowest:g}-{highest:g}, "
+                                 f"outside total_range {self.total_range}")
+
+    def values_from_answers(self, answers):
+        """(n, n_items) option indices -> item values; raises on out-of-range answers."""
+        answers = np.atleast_2d(np.asarray(answers, dtype=np.int64))
+        if answers.shape[1] != self.n_items:
+            raise ValueError(f"{self.title}: expected {self.n_items} answers, got {answers.shape[1]}")
+        bad = (answers < 0) | (answers >= self.n_options)
+        if bad.any():
+            row, item = np.argwhere(bad)[0]
+            raise ValueError(f"{self.title} q{self.item_ids[item]}: answer {answers[row, item]} out of range")
+        return self.option_values[np.arange(self.n_items), answers]
+
+    def score(self, values):
+        """
+        Score (n, n_items) item values. Returns a dict of length-n arrays: "total",
+        "band" (interpretation label or None), "positive" (None without a cutoff)
+        and one "<subscale>" entry per subscale. Rows with a missing (NaN) item get
+        a NaN total and no band.
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float)) * self.sign + self.offset
+        total = values[:, self.group_index].max(axis=2).sum(axis=1)
+
+        band = np.full(len(total), len(self.band_min))  # index of the None label
+        if len(self.band_min):
+            pos = np.searchsorted(self.band_min, total, side="right") - 1
+            hit = (pos >= 0) & (total <= self.band_max[np.maximum(pos, 0)])
+            band = np.where(hit, pos, band)
+        subscale_totals = values @ self.subscale_weights
+        if self.cutoff is not None:
+            screened = total if self.cutoff_column is None else subscale_totals[:, self.cutoff_column]
+            positive = screened >= self.cutoff
+            for i, minimum in self.screen_items:
+                positive &= values[:, i] >= minimum
+        else:
+            positive = np.full(len(total), None)
+        scores = {"total": total, "band": self.band_labels[band], "positive": positive}
+        for j, name in enumerate(self.subscale_names):
+            scores[name] = subscale_totals[:, j]
+        return scores
+
+
+_compiled = {}
+
+
+def compile_scoring(inventory):
+    """The CompiledScoring for an inventory, built once per title and item count."""
+    key = (inventory["title"], len(inventory["questions"]))
+    if key not in _compiled:
+        _compiled[key] = CompiledScoring(inventory)
+    return _compiled[key]
+
+
+def load_all(folder=INVENTORIES_DIR):
+    """{title: CompiledScoring} for every inventory JSON in the folder."""
+    scorers = {}
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".json"):
+            with open(os.path.join(folder, filename), "r", encoding="utf-8") as f:
+                inventory = json.load(f)
+            scorers[inventory["title"]] = compile_scoring(inventory)
+    return scorers
+
+
+def rescore(scores, scorers=None):
+    """
+    Re-score a ResultsStore.scores() DataFrame (needs "inventory" and "question_scores").
+    Adds "rescored_total", "band" and "positive" columns, one NumPy pass per inventory;
+    rows of unknown inventories or with the wrong item count are left as NaN/None.
+    """
+    scorers = scorers if scorers is not None else load_all()
+    scores = scores.copy()
+    scores["rescored_total"] = np.nan
+    scores["band"] = None
+    scores["positive"] = None
+    for title, rows in scores.groupby("inventory").groups.items():
+        scorer = scorers.get(title)
+        if scorer is None:
+            continue
+        items = scores.loc[rows, "question_scores"]
+        ok = items.map(len) == scorer.n_items
+        if not ok.any():
+            continue
+        rows = items.index[ok]
+        result = scorer.score(np.stack(items[ok].to_numpy()))
+        scores.loc[rows, "rescored_total"] = result["total"]
+        scores.loc[rows, "band"] = result["band"]
+        scores.loc[rows, "positive"] = result["positive"]
+    return scores
+
+
+def main():
+    from results_store import STORE_DIR, ResultsStore
+
+    parser = argparse.ArgumentParser(description="Re-score every stored result with the current inventories.")
+    parser.add_argument("store", nargs="?", default=STORE_DIR)
+    parser.add_argument("--inventory", default=None, help="only this inventory title")
+    parser.add_argument("--out", default=None, help="write the re-scored rows to this CSV")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.store)
+    try:
+        scores = store.scores(columns=["session_id", "model", "inventory", "total_score", "question_scores"],
+                              inventory=args.inventory)
+    finally:
+        store.close()
+    rescored = rescore(scores)
+    changed = rescored["rescored_total"].notna() & (rescored["rescored_total"] != rescored["total_score"])
+    print(rescored.groupby(["inventory", "band"], dropna=False).size().to_string())
+    print(f"\n{len(rescored)} results re-scored, {int(changed.sum())} totals differ from the stored ones")
+    if args.out:
+        rescored.drop(columns=["question_scores"]).to_csv(args.out, index=False)
+        print(f"✅ Re-scored results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
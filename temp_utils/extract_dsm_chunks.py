@@ -1,15 +1,34 @@
 import fitz  # PyMuPDF
 import os
+import re
 import json
-import textwrap
+import hashlib
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Directory to save extracted JSONL chunks
 OUTPUT_DIR = "dsm5_chunks"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Path to your DSM-5 PDF file (adjust if needed)
 PDF_PATH = "DSM5.pdf"
 
+# Extracted page text, one JSON per page under <PDF hash>/, so re-runs and newly
+# added ranges only extract pages that were never seen before
+PAGE_CACHE_DIR = "dsm5_page_cache"
+FORMAT_VERSION = 2          # bump when page extraction changes so cached pages are redone
+PROCESSES = os.cpu_count() or 1
+PAGES_PER_TASK = 8          # pages one worker extracts per PDF open
+
+# Layout-driven chunking
+MAX_CHUNK_WORDS = 400       # a chunk never grows past this; longer paragraphs split at sentences
+MIN_CHUNK_WORDS = 40        # a new criterion only starts a new chunk once the current one has this many
+HEADING_SIZE_RATIO = 1.15   # lines this much larger than the page's body text are headings
+HEADING_MAX_WORDS = 12      # bold lines up to this long (not ending a sentence) are headings too
+MARGIN_FRACTION = 0.06      # top/bottom share of the page holding running heads and page numbers
+CRITERION_RE = re.compile(r"^([A-H])\.\s")     # top-level diagnostic criterion: "A. Exposure to ..."
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
 # Mapping of disorder name to PDF page ranges (inclusive, 1-based page numbers)
 # PyMuPDF pages are 0-indexed internally, so we subtract 1 when extracting
 DISORDERS_PAGE_RANGES = {
@@ -25,61 +44,282 @@ DISORDERS_PAGE_RANGES = {
     "personality_pathology": (690, 694),
 }
 
-def extract_text_from_pages(doc, start_page, end_page):
-    """Extract and concatenate text from start_page to end_page inclusive (0-based)."""
-    texts = []
-    for i in range(start_page, end_page + 1):
-        page = doc.load_page(i)
-        texts.append(page.get_text("text"))
-    return "\n".join(texts)
-
-def chunk_text(text, max_words=400):
-    """Split text into chunks of approximately max_words words."""
-    words = text.split()
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def page_cache_path(cache_dir, pdf_hash, page_no):
+    return os.path.join(cache_dir, pdf_hash, f"{page_no}.json")
+
+
+# === PAGE EXTRACTION (worker processes) ===
+def _join_lines(lines):
+    """Join PDF lines into running text, undoing end-of-line hyphenation."""
+    text = ""
+    for line in lines:
+        if text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        else:
+            text = f"{text} {line}" if text else line
+    return text
+
+
+def classify_page(page):
+    """
+    Units of one page in reading order: {"kind": "heading" | "criterion" | "text", "text"},
+    headings also with their font "size". Headings are told apart from body text by font
+    size or bold weight, criteria by their "A." lead; running heads and page numbers in
+    the margins are dropped.
+    """
+    data = page.get_text("dict")
+    height = page.rect.height
+    lines = []
+    for block in data["blocks"]:
+        if block.get("type") != 0:
+            continue  # images
+        for line in block["lines"]:
+            spans = [s for s in line["spans"] if s["text"].strip()]
+            if not spans:
+                continue
+            y0, y1 = line["bbox"][1], line["bbox"][3]
+            if y1 < height * MARGIN_FRACTION or y0 > height * (1 - MARGIN_FRACTION):
+                continue
+            text = " ".join("".join(s["text"] for s in spans).split())
+            size = max(s["size"] for s in spans)
+            bold = all(s["flags"] & 16 for s in spans)
+            lines.append((block["number"], text, size, bold))
+    if not lines:
+        return []
+
+    # Body size: the font size carrying the most characters on the page
+    sizes = Counter()
+    for _, text, size, _ in lines:
+        sizes[round(size, 1)] += len(text)
+    body_size = sizes.most_common(1)[0][0]
+
+    units = []
+    current = None
+    for block_no, text, size, bold in lines:
+        words = len(text.split())
+        is_heading = (size >= body_size * HEADING_SIZE_RATIO or
+                      (bold and words <= HEADING_MAX_WORDS and not text.endswith((".", ":"))))
+        if is_heading:
+            kind = "heading"
+        elif CRITERION_RE.match(text):
+            kind = "criterion"
+        else:
+            kind = "text"
+        # Lines of one paragraph continue the current unit; headings, criteria and new blocks start one
+        if (current is not None and kind == "text" and current["kind"] != "heading"
+                and current["block"] == block_no):
+            current["lines"].append(text)
+            continue
+        if current is not None and kind == "heading" and current["kind"] == "heading" and current["block"] == block_no:
+            current["lines"].append(text)  # a heading wrapped over two lines
+            continue
+        current = {"kind": kind, "block": block_no, "lines": [text], "size": round(size, 1)}
+        units.append(current)
+    return [
+        {"kind": "heading", "text": _join_lines(u["lines"]), "size": u["size"]} if u["kind"] == "heading"
+        else {"kind": u["kind"], "text": _join_lines(u["lines"])}
+        for u in units
+    ]
+
+
+def extract_pages(pdf_path, pdf_hash, page_numbers, cache_dir):
+    """Worker: classify 1-based pages of the PDF and write each to the page cache. Returns the page count."""
+    doc = fitz.open(pdf_path)
+    try:
+        for page_no in page_numbers:
+            units = classify_page(doc.load_page(page_no - 1))
+            path = page_cache_path(cache_dir, pdf_hash, page_no)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"format": FORMAT_VERSION, "page": page_no, "units": units}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+    finally:
+        doc.close()
+    return len(page_numbers)
+
+
+def load_cached_page(cache_dir, pdf_hash, page_no):
+    path = page_cache_path(cache_dir, pdf_hash, page_no)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        cached = json.load(f)
+    return cached["units"] if cached.get("format") == FORMAT_VERSION else None
+
+
+def extract_missing_pages(pdf_path, pdf_hash, pages, cache_dir, processes=PROCESSES):
+    """Extract every page not yet in the cache, in runs of PAGES_PER_TASK across a process pool."""
+    os.makedirs(os.path.join(cache_dir, pdf_hash), exist_ok=True)
+    missing = sorted(p for p in pages if load_cached_page(cache_dir, pdf_hash, p) is None)
+    if not missing:
+        return 0
+    tasks = [missing[i:i + PAGES_PER_TASK] for i in range(0, len(missing), PAGES_PER_TASK)]
+    if processes <= 1 or len(tasks) == 1:
+        for task in tasks:
+            extract_pages(pdf_path, pdf_hash, task, cache_dir)
+        return len(missing)
+    with ProcessPoolExecutor(max_workers=min(processes, len(tasks))) as pool:
+        futures = {pool.submit(extract_pages, pdf_path, pdf_hash, task, cache_dir): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                task = futures[future]
+                print(f"❌ Error extracting pages {task[0]}-{task[-1]}: {e}")
+    return len(missing)
+
+
+# === CHUNKING ===
+def split_long(text, max_words=MAX_CHUNK_WORDS):
+    """Split text into pieces of at most max_words words, at sentence boundaries where possible."""
+    pieces = []
+    current = []
+    for sentence in SENTENCE_END_RE.split(text):
+        words = sentence.split()
+        while len(words) > max_words:  # a single overlong sentence is cut by words
+            if current:
+                pieces.append(" ".join(current))
+                current = []
+            pieces.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if len(current) + len(words) > max_words:
+            pieces.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_units(units, max_words=MAX_CHUNK_WORDS, min_words=MIN_CHUNK_WORDS):
+    """
+    Group (page, unit) pairs into chunks that respect the layout: a heading always
+    starts a chunk (consecutive headings share one), a criterion starts one once the
+    current chunk has min_words, and no chunk passes max_words. Each chunk records
+    its section, the path of headings it sits under ("Panic Disorder > Diagnostic
+    Criteria"; a heading closes the ones at its own size or smaller), criterion and
+    page span.
+    """
     chunks = []
-    for i in range(0, len(words), max_words):
-        chunk_words = words[i:i+max_words]
-        chunk_text = " ".join(chunk_words)
-        chunks.append(chunk_text.strip())
-    return chunks
-
-def save_chunks_to_jsonl(chunks, disorder_name):
-    """Save chunks as a jsonl file with disorder and chunk_id metadata."""
-    out_path = os.path.join(OUTPUT_DIR, f"{disorder_name}.jsonl")
-    with open(out_path, "w", encoding="utf-8") as f:
+    headings = []  # (size, text) of the enclosing headings, outermost first
+    section = None
+    criterion = None  # criterion the text belongs to, carried across chunk and page breaks
+    current = None
+
+    def flush():
+        nonlocal current
+        if current is not None and current["words"]:
+            chunks.append(current)
+        current = None
+
+    def start(page):
+        nonlocal current
+        current = {"parts": [], "words": 0, "section": section, "criterion": criterion,
+                   "page_start": page, "page_end": page}
+
+    for page, unit in units:
+        text = unit["text"]
+        kind = unit["kind"]
+        if kind == "heading":
+            size = unit.get("size", 0)
+            while headings and headings[-1][0] <= size:
+                headings.pop()
+            headings.append((size, text))
+            section = " > ".join(t for _, t in headings)
+            criterion = None
+            if current is None or current["words"]:
+                flush()
+                start(page)
+            current["section"] = section  # a heading alone is not a chunk (words stays 0)
+            current["parts"].append(text)
+            continue
+        if kind == "criterion":
+            criterion = CRITERION_RE.match(text).group(1)
+            if current is not None and current["words"] >= min_words:
+                flush()
+        for piece in split_long(text, max_words):
+            n = len(piece.split())
+            if current is not None and current["words"] and current["words"] + n > max_words:
+                flush()
+            if current is None:
+                start(page)
+            if current["criterion"] is None:
+                current["criterion"] = criterion
+            current["parts"].append(piece)
+            current["words"] += n
+            current["page_end"] = page
+    flush()
+    return [{
+        "text": "\n".join(c["parts"]),
+        "section": c["section"],
+        "criterion": c["criterion"],
+        "page_start": c["page_start"],
+        "page_end": c["page_end"],
+    } for c in chunks]
+
+
+def save_chunks_to_jsonl(chunks, disorder_name, output_dir=OUTPUT_DIR):
+    """Save chunks as a jsonl file with disorder, chunk_id and provenance metadata."""
+    out_path = os.path.join(output_dir, f"{disorder_name}.jsonl")
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         for idx, chunk in enumerate(chunks, start=1):
-            record = {
-                "disorder": disorder_name,
-                "chunk_id": idx,
-                "text": chunk
-            }
+            record = {"disorder": disorder_name, "chunk_id": idx}
+            record.update({k: v for k, v in chunk.items() if v is not None})
             f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, out_path)
     print(f"Saved {len(chunks)} chunks for '{disorder_name}' to {out_path}")
 
-def main():
-    if not os.path.exists(PDF_PATH):
-        print(f"DSM-5 PDF file not found at {PDF_PATH}")
-        return
-    
-    doc = fitz.open(PDF_PATH)
-    
-    for disorder, (start_page, end_page) in DISORDERS_PAGE_RANGES.items():
-        # Convert to zero-based page numbering
-        start_idx = start_page - 1
-        end_idx = end_page - 1
-        
-        print(f"Extracting {disorder}: pages {start_page}-{end_page} (zero-based {start_idx}-{end_idx})")
-        
-        full_text = extract_text_from_pages(doc, start_idx, end_idx)
-        
-        if not full_text.strip():
+
+def extract_disorders(pdf_path, ranges, output_dir=OUTPUT_DIR, cache_dir=PAGE_CACHE_DIR, processes=PROCESSES):
+    """Extract (cached) pages for every range, then chunk and save one JSONL per disorder."""
+    os.makedirs(output_dir, exist_ok=True)
+    pdf_hash = file_hash(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    pages = set()
+    for disorder, (start_page, end_page) in ranges.items():
+        if end_page > page_count:
+            print(f"Warning: {disorder} pages {start_page}-{end_page} run past the PDF's {page_count} pages")
+        pages.update(range(start_page, min(end_page, page_count) + 1))
+
+    extracted = extract_missing_pages(pdf_path, pdf_hash, pages, cache_dir, processes)
+    print(f"Extracted {extracted} new pages ({len(pages) - extracted} from cache)")
+
+    for disorder, (start_page, end_page) in ranges.items():
+        units = []
+        for page_no in range(start_page, min(end_page, page_count) + 1):
+            units.extend((page_no, unit) for unit in load_cached_page(cache_dir, pdf_hash, page_no) or [])
+        if not units:
             print(f"Warning: No text extracted for {disorder} pages {start_page}-{end_page}")
             continue
-        
-        chunks = chunk_text(full_text, max_words=400)
-        save_chunks_to_jsonl(chunks, disorder)
+        save_chunks_to_jsonl(chunk_units(units), disorder, output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract DSM-5 disorder sections into JSONL chunks.")
+    parser.add_argument("--pdf", default=PDF_PATH)
+    parser.add_argument("--out", default=OUTPUT_DIR)
+    parser.add_argument("--cache", default=PAGE_CACHE_DIR)
+    parser.add_argument("--processes", type=int, default=PROCESSES)
+    parser.add_argument("disorders", nargs="*", help="only these disorders (default: all)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.pdf):
+        print(f"DSM-5 PDF file not found at {args.pdf}")
+        return
+    ranges = {d: r for d, r in DISORDERS_PAGE_RANGES.items() if not args.disorders or d in args.disorders}
+    extract_disorders(args.pdf, ranges, args.out, args.cache, args.processes)
 
-    doc.close()
 
 if __name__ == "__main__":
     main()
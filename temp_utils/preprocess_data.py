@@ -1,89 +1,251 @@
 # Olive/preprocess_data.py
 
 import os
-import pandas as pd
 import json
+import hashlib
+import pandas as pd
+from functools import reduce
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Where to save processed files (change if needed)
 PROCESSED_DIR = "output/processed_chunks"
+DAIC_WOZ_PARTS_DIR = os.path.join(PROCESSED_DIR, "daic_woz_parts")   # one JSONL per transcript
+MANIFEST_PATH = os.path.join(PROCESSED_DIR, "manifest.json")        # source hashes of the last run
+FORMAT_VERSION = 4        # bump when chunk formatting changes so every output is rebuilt
+CSV_BLOCK_ROWS = 5000     # rows read per block, keeps memory flat for big CSVs
+PROCESSES = os.cpu_count() or 1
+
+# DAIC-WOZ windowing: participant speech merged into overlapping, token-bounded chunks
+INTERVIEWER = "Ellie"     # scripted prompts repeated in every transcript, dropped from chunks
+WINDOW_TOKENS = 200       # max whitespace tokens per chunk
+OVERLAP_TOKENS = 40       # tokens carried over from the end of the previous chunk
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
+
+# === SHARED HELPERS ===
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest):
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def is_unchanged(manifest, out_path, source_hash):
+    entry = manifest.get(out_path)
+    return (
+        os.path.exists(out_path)
+        and entry is not None
+        and entry.get("hash") == source_hash
+        and entry.get("format") == FORMAT_VERSION
+    )
+
+
+def rows_to_text(df):
+    """Vectorized 'col: value | col: value' text for every row of a block."""
+    # fillna keeps the old "nan" text for missing cells on pandas versions where astype(str) preserves NaN
+    parts = [col + ": " + df[col].astype(str).fillna("nan") for col in df.columns]
+    return reduce(lambda left, right: left + " | " + right, parts)
+
+
+def write_jsonl(df, f):
+    """Append a DataFrame as JSON lines (one record per row) to an open file."""
+    # json.dumps, not DataFrame.to_json: to_json drops the space after ":" and escapes "/" as "\/"
+    f.writelines(json.dumps(record) + "\n" for record in df.to_dict("records"))
+
+
+def preprocess_table(csv_path, out_name, label, manifest):
+    """Stream a one-row-per-record CSV into a JSONL of text chunks, block by block."""
+    out_path = os.path.join(PROCESSED_DIR, out_name)
+    source_hash = file_hash(csv_path)
+    if is_unchanged(manifest, out_path, source_hash):
+        print(f"{label} unchanged, keeping {out_path}")
+        return
+    rows = 0
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for block in pd.read_csv(csv_path, chunksize=CSV_BLOCK_ROWS):
+            write_jsonl(pd.DataFrame({"text": rows_to_text(block)}), f)
+            rows += len(block)
+    os.replace(tmp, out_path)
+    manifest[out_path] = {"hash": source_hash, "format": FORMAT_VERSION}
+    print(f"{label} preprocessed, {rows} rows saved to: {out_path}")
+
+
 # === OCD DATASET PREPROCESSING ===
-def preprocess_ocd(csv_path):
-    df = pd.read_csv(csv_path)
-    chunk_texts = []
-    for idx, row in df.iterrows():
-        # Build unified text chunk per patient
-        text = " | ".join([f"{col}: {row[col]}" for col in df.columns])
-        chunk_texts.append(text)
-    # Save as a JSONL file (one chunk per line)
-    out_path = os.path.join(PROCESSED_DIR, "ocd_chunks.jsonl")
-    with open(out_path, "w", encoding="utf-8") as f:
-        for chunk in chunk_texts:
-            f.write(json.dumps({"text": chunk}) + "\n")
-    print(f"OCD preprocessed, {len(chunk_texts)} rows saved to: {out_path}")
+def preprocess_ocd(csv_path, manifest):
+    preprocess_table(csv_path, "ocd_chunks.jsonl", "OCD", manifest)
+
 
 # === PTSD DATASET PREPROCESSING ===
-def preprocess_ptsd(csv_path):
-    df = pd.read_csv(csv_path)
-    chunk_texts = []
-    for idx, row in df.iterrows():
-        text = " | ".join([f"{col}: {row[col]}" for col in df.columns])
-        chunk_texts.append(text)    
-    out_path = os.path.join(PROCESSED_DIR, "ptsd_chunks.jsonl")
-    with open(out_path, "w", encoding="utf-8") as f:
-        for chunk in chunk_texts:
-            f.write(json.dumps({"text": chunk}) + "\n")
-    print(f"PTSD preprocessed, {len(chunk_texts)} rows saved to: {out_path}")
+def preprocess_ptsd(csv_path, manifest):
+    preprocess_table(csv_path, "ptsd_chunks.jsonl", "PTSD", manifest)
 
 
 # === DAIC-WOZ TRANSCRIPTS PREPROCESSING ===
-def preprocess_daic_woz(transcript_dir):
-    chunk_texts = []
-    for filename in os.listdir(transcript_dir):
-        if filename.endswith(".csv") or filename.endswith(".txt"):
-            path = os.path.join(transcript_dir, filename)
-            try:
-                if filename.endswith(".csv"):
-                    df = pd.read_csv(path)
-                    # If columns named 'speaker' and 'utterance' (adjust if needed)
-                    colnames = [c.lower() for c in df.columns]
-                    for idx, row in df.iterrows():
-                        # Use speaker and utterance columns, or adjust to file format
-                        if 'speaker' in colnames and 'utterance' in colnames:
-                            text = f"{row['speaker']}: {row['utterance']}"
-                        else:
-                            # Fallback: join all columns as text if unsure
-                            text = " | ".join([str(cell) for cell in row.values])
-                        chunk_texts.append(text)
-                elif filename.endswith(".txt"):
-                    with open(path, "r", encoding="utf-8") as f:
-                        for line in f:
-                            chunk_texts.append(line.strip())
-            except Exception as e:
-                print(f"❌ Error parsing {filename}: {e}")
+def load_avec_splits(transcript_dir):
+    """Participant ID -> AVEC 2017 split, from the *_split_Depression_AVEC2017.csv files in Metadata/."""
+    metadata_dir = os.path.join(transcript_dir, "Metadata")
+    splits = {}
+    if os.path.isdir(metadata_dir):
+        for filename in os.listdir(metadata_dir):
+            if filename.endswith("_AVEC2017.csv") and "_split_" in filename:
+                split = filename.split("_split_")[0]
+                ids = pd.read_csv(os.path.join(metadata_dir, filename)).iloc[:, 0]
+                splits.update({str(pid): split for pid in ids})
+    # The AVEC partition covers every session, so without a train list the rest is train
+    has_train = "train" in splits.values()
+    return splits, ("unknown" if has_train or not splits else "train")
+
+
+def window_utterances(utterances, window_tokens=WINDOW_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    Group (start, stop, text) utterances into windows of at most window_tokens tokens,
+    each starting with the last ~overlap_tokens tokens of the previous window.
+    An utterance longer than the whole window becomes a window on its own.
+    """
+    windows = []
+    current = []
+    tokens = 0
+    for utterance in utterances:
+        n = len(utterance[2].split())
+        if current and tokens + n > window_tokens:
+            windows.append(current)
+            # Carry whole utterances from the tail so no sentence is cut in half
+            carry = []
+            carried = 0
+            for previous in reversed(current):
+                m = len(previous[2].split())
+                if carried + m > overlap_tokens or carried + m + n > window_tokens:
+                    break
+                carry.insert(0, previous)
+                carried += m
+            current = carry
+            tokens = carried
+        current.append(utterance)
+        tokens += n
+    if current:
+        windows.append(current)
+    return windows
+
+
+def process_transcript(path, part_path, split="unknown"):
+    """Worker: turn one transcript into its own JSONL part file. Returns the chunk count."""
+    participant = os.path.basename(path).split("_")[0]
+    if path.endswith(".csv"):
+        # DAIC-WOZ transcripts are tab-separated: start_time, stop_time, speaker, value
+        df = pd.read_csv(path, sep="\t")
+        df.columns = [c.lower() for c in df.columns]
+        df = df.dropna(subset=["value"])
+        df = df[df["speaker"].astype(str) != INTERVIEWER]
+        texts = df["value"].astype(str).str.strip()
+        utterances = [
+            (start, stop, text)
+            for start, stop, text in zip(df["start_time"], df["stop_time"], texts)
+            if text
+        ]
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            utterances = [(None, None, line.strip()) for line in f if line.strip()]
+
+    windows = window_utterances(utterances)
+    out = pd.DataFrame({
+        "text": [" ".join(u[2] for u in w) for w in windows],
+        "participant_id": participant,
+        "split": split,
+        "start_time": [w[0][0] for w in windows],
+        "stop_time": [w[-1][1] for w in windows],
+        "utterances": [len(w) for w in windows],
+    })
+
+    tmp = part_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        write_jsonl(out, f)
+    os.replace(tmp, part_path)
+    return len(out)
+
+
+def preprocess_daic_woz(transcript_dir, manifest, processes=PROCESSES):
+    os.makedirs(DAIC_WOZ_PARTS_DIR, exist_ok=True)
+    filenames = sorted(f for f in os.listdir(transcript_dir) if f.endswith(".csv") or f.endswith(".txt"))
+    splits, default_split = load_avec_splits(transcript_dir)
+
+    # Only transcripts whose content changed since the last run are re-processed
+    jobs = {}
+    for filename in filenames:
+        path = os.path.join(transcript_dir, filename)
+        part_path = os.path.join(DAIC_WOZ_PARTS_DIR, os.path.splitext(filename)[0] + ".jsonl")
+        source_hash = file_hash(path)
+        if not is_unchanged(manifest, part_path, source_hash):
+            split = splits.get(filename.split("_")[0], default_split)
+            jobs[part_path] = (path, source_hash, split)
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {
+                pool.submit(process_transcript, path, part, split): part
+                for part, (path, _, split) in jobs.items()
+            }
+            for future in as_completed(futures):
+                part_path = futures[future]
+                try:
+                    future.result()
+                    manifest[part_path] = {"hash": jobs[part_path][1], "format": FORMAT_VERSION}
+                except Exception as e:
+                    print(f"❌ Error parsing {os.path.basename(jobs[part_path][0])}: {e}")
+
+    # Stitch the part files together without holding them in memory
     out_path = os.path.join(PROCESSED_DIR, "daic_woz_chunks.jsonl")
-    with open(out_path, "w", encoding="utf-8") as f:
-        for chunk in chunk_texts:
-            f.write(json.dumps({"text": chunk}) + "\n")
-    print(f"DAIC-WOZ preprocessed, {len(chunk_texts)} chunks saved to: {out_path}")
+    chunks = 0
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        for filename in filenames:
+            part_path = os.path.join(DAIC_WOZ_PARTS_DIR, os.path.splitext(filename)[0] + ".jsonl")
+            if part_path not in manifest or not os.path.exists(part_path):
+                continue
+            with open(part_path, "r", encoding="utf-8") as part:
+                for line in part:
+                    out.write(line)
+                    chunks += 1
+    os.replace(tmp, out_path)
+    print(f"DAIC-WOZ preprocessed ({len(jobs)} of {len(filenames)} transcripts re-processed), "
+          f"{chunks} chunks saved to: {out_path}")
+
 
 # === MAIN EXECUTION ===
 if __name__ == "__main__":
     # Set your filenames/paths here
-    OCD_CSV = "Data/ocd_patient_dataset.csv"
-    PTSD_CSV = "Data/PTSD-Repository-Study-Characteristics.csv"
-    DAIC_WOZ_DIR = "Data/DAIC-WOZ Transcripts"
+    OCD_CSV = "Data/raw/ocd_patient_dataset.csv"
+    PTSD_CSV = "Data/raw/PTSD-Repository-Study-Characteristics.csv"
+    DAIC_WOZ_DIR = "Data/raw/DAIC-WOZ Transcripts"
 
-    if os.path.exists(OCD_CSV):
-        preprocess_ocd(OCD_CSV)
-    else:
-        print(f"OCD dataset not found at {OCD_CSV}")
-    if os.path.exists(PTSD_CSV):
-        preprocess_ptsd(PTSD_CSV)
-    else:
-        print(f"PTSD repository not found at {PTSD_CSV}")
-    if os.path.exists(DAIC_WOZ_DIR):
-        preprocess_daic_woz(DAIC_WOZ_DIR)
-    else:
-        print(f"DAIC-WOZ transcripts folder not found at {DAIC_WOZ_DIR}")
+    manifest = load_manifest()
+    try:
+        if os.path.exists(OCD_CSV):
+            preprocess_ocd(OCD_CSV, manifest)
+        else:
+            print(f"OCD dataset not found at {OCD_CSV}")
+        if os.path.exists(PTSD_CSV):
+            preprocess_ptsd(PTSD_CSV, manifest)
+        else:
+            print(f"PTSD repository not found at {PTSD_CSV}")
+        if os.path.exists(DAIC_WOZ_DIR):
+            preprocess_daic_woz(DAIC_WOZ_DIR, manifest)
+        else:
+            print(f"DAIC-WOZ transcripts folder not found at {DAIC_WOZ_DIR}")
+    finally:
+        save_manifest(manifest)
@@ -0,0 +1,44 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+CORPUS = [
+    ("Generalized anxiety disorder: excessive worry about many events, restlessness and poor sleep.", "anxiety"),
+    ("Panic attacks are abrupt surges of intense fear with a racing heart and shortness of breath.", "anxiety"),
+    ("Major depressive episode: depressed mood, loss of interest, hopelessness and fatigue.", "depression"),
+    ("Intrusive memories, nightmares and flashbacks after a traumatic event.", "ptsd"),
+    ("Obsessions and compulsions such as repeated checking and hand washing.", "ocd"),
+]
+
+
+class HashingEncoder:
+    """Stands in for a SentenceTransformer: a normalized bag of hashed words."""
+    dim = 64
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+@pytest.fixture
+def encoder():
+    return HashingEncoder()
+
+
+@pytest.fixture
+def tiny_retriever(encoder):
+    """In-memory retriever over a few DSM-style chunks, with no model download."""
+    from retrieval import SemanticRetriever
+
+    texts = [t for t, _ in CORPUS]
+    metas = [{"source": "dsm5", "disorder": d} for _, d in CORPUS]
+    return SemanticRetriever.from_texts(texts, metas=metas, embed_model="test-hashing-encoder", model=encoder)
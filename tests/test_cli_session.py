@@ -0,0 +1,104 @@
+import os
+import csv
+import json
+import asyncio
+
+import pytest
+
+import interface.cli as cli
+
+
+def all_answers():
+    """Option 1 (or 0) for every item of every inventory, so any selection can be replayed."""
+    answers = {}
+    for filename in cli.list_json_files("inventories"):
+        with open(os.path.join("inventories", filename), encoding="utf-8") as f:
+            answers[filename] = [min(1, len(q["options"]) - 1) for q in json.load(f)["questions"]]
+    return answers
+
+
+SCRIPT = {
+    "id": "test",
+    "first_name": "Jane",
+    "last_name": "Doe",
+    "dob": "01/01/1990",
+    "self_report": "I worry all the time and cannot sleep",
+    "answers": all_answers(),
+}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """
+    Replies like the LLM: the first offered candidate for the selection prompt
+    (constrained by its JSON schema), an impression otherwise. Returns the
+    keyword arguments of every call.
+    """
+    calls = []
+
+    def query_llm(prompt, model, format=None, **kwargs):
+        calls.append(kwargs)
+        if format is not None:
+            return json.dumps({"inventories": format["properties"]["inventories"]["items"]["enum"][:1]})
+        return "Impression: generalized anxiety is likely."
+
+    monkeypatch.setattr(cli, "query_llm", query_llm)
+    return calls
+
+
+@pytest.fixture
+def output(monkeypatch, tmp_path):
+    csv_path = tmp_path / "JD_1990_01_01_phi.csv"
+    monkeypatch.setattr(cli, "generate_output_filename", lambda *args: str(csv_path))
+    return csv_path
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_session_without_results_store(monkeypatch, tiny_retriever, llm, output):
+    monkeypatch.setattr(cli, "open_results_store", lambda *args: None)  # as without pyarrow
+    outcome = asyncio.run(cli.run_session(tiny_retriever, script=SCRIPT, model="phi"))
+
+    assert len(outcome["chosen_inventories"]) == 1
+    assert len(outcome["results"]) == 2 and outcome["results"][0]["name"] == "PHQ-4"
+    assert "store_session_id" not in outcome
+    rows = read_csv(output)
+    assert rows[0][3] == "Impression: generalized anxiety is likely."
+    assert [r[0] for r in rows[2:]] == [r["name"] for r in outcome["results"]]
+    assert output.with_suffix(".trace.jsonl").exists()
+
+
+def test_session_store_row_gets_the_impression(tiny_retriever, llm, output, tmp_path):
+    from results_store import ResultsStore
+
+    store = ResultsStore(str(tmp_path / "store"))
+    try:
+        outcome = asyncio.run(cli.run_session(tiny_retriever, script=SCRIPT, model="phi", store=store))
+        session = store.sessions(session_id=outcome["store_session_id"]).iloc[0]
+        scores = store.scores(session_id=outcome["store_session_id"])
+    finally:
+        store.close()
+    assert session.diagnostic_impression == "Impression: generalized anxiety is likely."
+    timings = dict(session.timings)
+    assert "save_scores" in timings and "diagnostic_impression" in timings
+    assert sorted(scores.inventory) == sorted(r["name"] for r in outcome["results"])
+
+
+def test_llm_cache_is_opt_in(monkeypatch, tiny_retriever, llm):
+    asyncio.run(cli.run_session(tiny_retriever, script=SCRIPT, model="phi", save_csv=False))
+    assert len(llm) == 2 and not any(call["use_cache"] for call in llm)
+    llm.clear()
+    asyncio.run(cli.run_session(tiny_retriever, script=SCRIPT, model="phi", save_csv=False, use_cache=True))
+    assert len(llm) == 2 and all(call["use_cache"] for call in llm)
+
+
+def test_self_report_is_encoded_once(monkeypatch, tiny_retriever, llm):
+    encoded = []
+    encode_queries = tiny_retriever.encode_queries
+    monkeypatch.setattr(tiny_retriever, "encode_queries",
+                        lambda queries: encoded.extend(queries) or encode_queries(queries))
+    asyncio.run(cli.run_session(tiny_retriever, script=SCRIPT, model="phi", save_csv=False))
+    assert encoded.count(SCRIPT["self_report"]) == 1
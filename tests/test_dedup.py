@@ -0,0 +1,51 @@
+import numpy as np
+
+from dedup import cluster_counts, deduplicate
+
+FIELDS = [
+    ("Patient ID", "1018"), ("Age", "32"), ("Gender", "Female"), ("Ethnicity", "African"),
+    ("Marital Status", "Single"), ("Education Level", "Some College"), ("OCD Diagnosis Date", "2016-07-15"),
+    ("Duration of Symptoms (months)", "203"), ("Previous Diagnoses", "MDD"), ("Family History of OCD", "No"),
+    ("Obsession Type", "Harm-related"), ("Compulsion Type", "Checking"), ("Y-BOCS Score (Obsessions)", "17"),
+    ("Y-BOCS Score (Compulsions)", "10"), ("Depression Diagnosis", "Yes"), ("Anxiety Diagnosis", "Yes"),
+    ("Medications", "SNRI"),
+]
+
+
+def row(changes=()):
+    """A templated "Field: value | ..." row like Data/dataset_chunks/ocd_chunks.jsonl, with some values changed."""
+    values = dict(FIELDS)
+    values.update(changes)
+    return " | ".join(f"{k}: {v}" for k, v in values.items())
+
+
+def test_templated_rows_differing_in_one_value_collapse():
+    texts = [row(), row({"Medications": "SSRI"}), row({"Patient ID": "4242"}), row().upper().replace(" | ", "  |  ")]
+    assert deduplicate(texts).tolist() == [0, 0, 0, 0]
+
+
+def test_distinct_templated_records_are_kept():
+    # Rows of the shipped OCD data differ in most of their values, so each is its own record
+    texts = [
+        row(),
+        row({"Patient ID": "2406", "Age": "69", "Gender": "Male", "Marital Status": "Divorced",
+             "OCD Diagnosis Date": "2017-04-28", "Duration of Symptoms (months)": "180",
+             "Family History of OCD": "Yes", "Compulsion Type": "Washing",
+             "Y-BOCS Score (Obsessions)": "21", "Y-BOCS Score (Compulsions)": "25", "Medications": "SSRI"}),
+    ]
+    assert deduplicate(texts).tolist() == [0, 1]
+
+
+def test_first_occurrence_represents_its_cluster():
+    texts = ["Panic attacks come on suddenly.", "Worry about many events.", "panic  attacks come on suddenly."]
+    reps = deduplicate(texts)
+    assert reps.tolist() == [0, 1, 0]
+    kept, counts = cluster_counts(reps)
+    assert kept.tolist() == [0, 1]
+    assert counts.tolist() == [2, 1]
+    assert deduplicate(texts[:2]).tolist() == reps[:2].tolist()
+
+
+def test_exact_only_when_max_distance_is_zero():
+    texts = [row(), row({"Medications": "SSRI"}), row()]
+    assert np.array_equal(deduplicate(texts, max_distance=0), [0, 1, 0])
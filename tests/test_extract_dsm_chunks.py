@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from temp_utils.extract_dsm_chunks import chunk_units, classify_page, extract_disorders
+
+FILLER = ("The symptoms are present most of the day, nearly every day, and cause clinically significant "
+          "distress or impairment in social, occupational or other important areas of functioning. ")
+
+
+def criterion(letter):
+    return f"{letter}. {FILLER * 2}"
+
+
+def write_pdf(path):
+    """Two DSM-like pages: a disorder title straight above "Diagnostic Criteria", criteria A-C
+    running over the page break, then a second subsection, with running heads and page numbers."""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 30), "Anxiety Disorders", fontsize=9)
+    page.insert_text((72, 90), "Panic Disorder", fontsize=16, fontname="hebo")
+    page.insert_text((72, 120), "Diagnostic Criteria", fontsize=12, fontname="hebo")
+    page.insert_textbox(fitz.Rect(72, 140, 540, 300), criterion("A"), fontsize=10)
+    page.insert_textbox(fitz.Rect(72, 310, 540, 470), criterion("B"), fontsize=10)
+    page.insert_textbox(fitz.Rect(72, 480, 540, 640), "C. " + FILLER, fontsize=10)
+    page.insert_text((300, 820), "208", fontsize=9)
+
+    page = doc.new_page()
+    page.insert_text((72, 30), "Anxiety Disorders", fontsize=9)
+    page.insert_textbox(fitz.Rect(72, 80, 540, 240), FILLER * 2, fontsize=10)
+    page.insert_text((72, 270), "Diagnostic Features", fontsize=12, fontname="hebo")
+    page.insert_textbox(fitz.Rect(72, 290, 540, 450), FILLER * 2, fontsize=10)
+    page.insert_text((300, 820), "209", fontsize=9)
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "dsm.pdf"
+    write_pdf(path)
+    return path
+
+
+def test_classify_page_finds_headings_and_criteria(pdf):
+    with fitz.open(str(pdf)) as doc:
+        units = classify_page(doc.load_page(0))
+    kinds = [(u["kind"], u["text"].split(".")[0]) for u in units]
+    assert kinds[:3] == [("heading", "Panic Disorder"), ("heading", "Diagnostic Criteria"), ("criterion", "A")]
+    assert [u["text"][0] for u in units if u["kind"] == "criterion"] == ["A", "B", "C"]
+    assert units[0]["size"] > units[1]["size"]
+    text = " ".join(u["text"] for u in units)
+    assert "Anxiety Disorders" not in text and "208" not in text  # margins dropped
+
+
+def test_consecutive_headings_form_a_path():
+    units = [
+        (1, {"kind": "heading", "text": "Panic Disorder", "size": 16}),
+        (1, {"kind": "heading", "text": "Diagnostic Criteria", "size": 12}),
+        (1, {"kind": "criterion", "text": criterion("A")}),
+        (2, {"kind": "heading", "text": "Diagnostic Features", "size": 12}),
+        (2, {"kind": "text", "text": FILLER}),
+        (3, {"kind": "heading", "text": "Agoraphobia", "size": 16}),
+        (3, {"kind": "text", "text": FILLER}),
+    ]
+    chunks = chunk_units(units)
+    assert [c["section"] for c in chunks] == [
+        "Panic Disorder > Diagnostic Criteria",
+        "Panic Disorder > Diagnostic Features",
+        "Agoraphobia",
+    ]
+    assert chunks[0]["text"].startswith("Panic Disorder\nDiagnostic Criteria\nA. ")
+
+
+def test_extract_disorders_writes_chunks_and_caches_pages(pdf, tmp_path, capsys):
+    out, cache = tmp_path / "chunks", tmp_path / "cache"
+    extract_disorders(str(pdf), {"panic": (1, 2)}, str(out), str(cache), processes=1)
+    with open(out / "panic.jsonl", encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f]
+
+    assert [c["chunk_id"] for c in chunks] == list(range(1, len(chunks) + 1))
+    assert all(c["disorder"] == "panic" for c in chunks)
+    criteria = [c for c in chunks if c["section"] == "Panic Disorder > Diagnostic Criteria"]
+    assert [c.get("criterion") for c in criteria] == ["A", "B", "C"]
+    # C runs over the page break and keeps its criterion
+    assert (criteria[-1]["page_start"], criteria[-1]["page_end"]) == (1, 2)
+    assert chunks[-1]["section"] == "Panic Disorder > Diagnostic Features"
+    assert chunks[-1]["page_start"] == 2
+    assert "Extracted 2 new pages" in capsys.readouterr().out
+
+    extract_disorders(str(pdf), {"panic": (1, 2)}, str(out), str(cache), processes=1)
+    assert "Extracted 0 new pages (2 from cache)" in capsys.readouterr().out
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from ivf_index import IVFIndex, recall_at_k, top_k
+
+DIM = 32
+TOP_N = 10
+
+
+def unit_vectors(rng, n, dim=DIM):
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Clustered unit vectors (like chunk embeddings) plus queries drawn near them."""
+    rng = np.random.default_rng(0)
+    centers = unit_vectors(rng, 40)
+    rows = centers[rng.integers(0, len(centers), size=4000)] + 0.35 * unit_vectors(rng, 4000)
+    matrix = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+    queries = matrix[rng.choice(len(matrix), size=50, replace=False)] + 0.1 * unit_vectors(rng, 50)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return matrix, queries
+
+
+def exact_ids(matrix, queries, k=TOP_N):
+    return [top_k(matrix @ q, k) for q in queries]
+
+
+def test_top_k_matches_full_sort():
+    scores = np.random.default_rng(1).standard_normal((3, 100))
+    assert np.array_equal(top_k(scores, 5), np.argsort(-scores, axis=1)[:, :5])
+    assert top_k(scores, 500).shape == (3, 100)
+
+
+def test_probing_every_list_is_exact(corpus):
+    matrix, queries = corpus
+    ivf = IVFIndex.build(matrix, seed=0)
+    ids, scores = ivf.search(matrix, queries, TOP_N, nprobe=ivf.nlist)
+    assert recall_at_k(ids, exact_ids(matrix, queries)) == 1.0
+    for q, s in zip(queries, scores):
+        assert np.allclose(s, np.sort(matrix @ q)[::-1][:TOP_N], atol=1e-5)
+
+
+def test_recall_at_default_nprobe(corpus):
+    matrix, queries = corpus
+    ivf = IVFIndex.build(matrix, seed=0)
+    stats = {}
+    ids, _ = ivf.search(matrix, queries, TOP_N, nprobe=16, stats=stats)
+    assert recall_at_k(ids, exact_ids(matrix, queries)) >= 0.95
+    assert stats["candidates"] < len(matrix) * len(queries)  # it did not scan everything
+
+
+def test_recall_grows_with_nprobe(corpus):
+    matrix, queries = corpus
+    ivf = IVFIndex.build(matrix, seed=0)
+    exact = exact_ids(matrix, queries)
+    recalls = [recall_at_k(ivf.search(matrix, queries, TOP_N, nprobe=p)[0], exact) for p in (1, 4, 16, ivf.nlist)]
+    assert recalls == sorted(recalls)
+
+
+def test_allowed_restricts_results(corpus):
+    matrix, queries = corpus
+    ivf = IVFIndex.build(matrix, seed=0)
+    allowed = np.arange(0, len(matrix), 3)
+    ids, _ = ivf.search(matrix, queries, TOP_N, nprobe=ivf.nlist, allowed=allowed)
+    restricted = [allowed[top_k(matrix[allowed] @ q, TOP_N)] for q in queries]
+    assert recall_at_k(ids, restricted) == 1.0
+
+
+def test_save_load_round_trip(corpus, tmp_path):
+    matrix, queries = corpus
+    ivf = IVFIndex.build(matrix, seed=0)
+    ivf.save(tmp_path)
+    loaded = IVFIndex.load(tmp_path)
+    for a, b in zip(ivf.search(matrix, queries, TOP_N)[0], loaded.search(matrix, queries, TOP_N)[0]):
+        assert np.array_equal(a, b)
@@ -0,0 +1,109 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm.local_llm import OllamaClient
+
+PIECES = ["Hello", ", ", "world", "."]
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """/api/generate as Ollama serves it: chunked NDJSON, one line per generated piece."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.client_address, payload))
+        if payload.get("model") == "missing":
+            body = b'{"error": "model not found"}'
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        lines = [{"response": p, "done": False} for p in PIECES]
+        lines.append({"response": "", "done": True, "eval_count": len(PIECES), "eval_duration": 2_000_000})
+        for line in lines if payload.get("stream") else lines[-1:]:
+            data = json.dumps(line).encode("utf-8") + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        # Drop the keep-alive connection without telling the client, as a restarted server would
+        self.close_connection = self.server.drop_connections
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    httpd.requests = []
+    httpd.drop_connections = False
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client(server):
+    return OllamaClient(f"http://127.0.0.1:{server.server_address[1]}", pool_size=2, timeout=5)
+
+
+def connections(server):
+    """Distinct client sockets that sent the recorded requests."""
+    return len({address for address, _ in server.requests})
+
+
+def test_stream_yields_pieces_and_stats(server, client):
+    stats = {}
+    pieces = list(client.stream("hi", model="phi", options={"num_predict": 8}, stats=stats, format="json"))
+    assert pieces == PIECES
+    assert stats == {"eval_count": len(PIECES), "eval_duration": 2_000_000}
+    _, payload = server.requests[0]
+    assert payload["stream"] is True
+    assert payload["options"] == {"num_predict": 8}
+    assert payload["format"] == "json"
+
+
+def test_connection_is_reused(server, client):
+    assert client.generate("one") == "".join(PIECES)
+    assert client.generate("two") == "".join(PIECES)
+    client.preload("phi")
+    assert len(server.requests) == 3
+    assert connections(server) == 1
+
+
+def test_stale_connection_is_retried(server, client, monkeypatch):
+    server.drop_connections = True
+    assert client.generate("one") == "".join(PIECES)
+    acquired = []
+    acquire = client._acquire
+    monkeypatch.setattr(client, "_acquire", lambda: acquired.append(1) or acquire())
+    # The pooled connection was closed by the server; the client retries on a fresh one
+    assert client.generate("two") == "".join(PIECES)
+    assert len(acquired) == 2
+    assert len(server.requests) == 2
+    assert connections(server) == 2
+
+
+def test_early_close_discards_connection(server, client):
+    stream = client.stream("hi")
+    assert next(stream) == PIECES[0]
+    stream.close()  # the consumer stops reading mid-response
+    assert client._pool.empty()
+    assert client.generate("again") == "".join(PIECES)
+    assert connections(server) == 2
+
+
+def test_http_error_is_raised(client):
+    with pytest.raises(RuntimeError, match="HTTP 404"):
+        client.generate("hi", model="missing")
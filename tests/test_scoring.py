@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scoring import CompiledScoring, load_all, rescore
+from utils import administer_inventory, load_inventory
+
+
+def inventory(n_items, scoring=None, values=(0, 1, 2, 3), title="Test"):
+    questions = [{"id": i + 1, "text": f"item {i + 1}", "options": [{"label": str(v), "value": v} for v in values]}
+                 for i in range(n_items)]
+    return {"title": title, "questions": questions, **({"scoring": scoring} if scoring else {})}
+
+
+def test_plain_sum_without_rules():
+    scorer = CompiledScoring(load_inventory("inventories/GAD-7.json"))
+    answers = np.random.default_rng(0).integers(0, 4, size=(50, 7))
+    values = scorer.values_from_answers(answers)
+    assert np.array_equal(scorer.score(values)["total"], values.sum(axis=1))
+
+
+def test_out_of_range_answer_raises():
+    scorer = CompiledScoring(inventory(3))
+    with pytest.raises(ValueError, match="q2: answer 4 out of range"):
+        scorer.values_from_answers([[0, 4, 0]])
+    with pytest.raises(ValueError, match="expected 3 answers"):
+        scorer.values_from_answers([[0, 1]])
+
+
+def test_reverse_keying_and_bands():
+    scoring = {"reverse_keyed": [2], "interpretation": [{"min": 0, "max": 2, "label": "low"},
+                                                         {"min": 3, "max": 6, "label": "high"}]}
+    scorer = CompiledScoring(inventory(2, scoring))
+    scores = scorer.score([[0, 0], [3, 3], [1, 2]])
+    assert scores["total"].tolist() == [3, 3, 2]  # item 2 counts 3 - value
+    assert scores["band"].tolist() == ["high", "high", "low"]
+
+
+def test_total_range_must_cover_the_items():
+    with pytest.raises(ValueError, match="outside total_range"):
+        CompiledScoring(inventory(5, {"total_range": [0, 10]}))
+    assert CompiledScoring(inventory(5, {"total_range": [0, 15]})).total_range == [0, 15]
+
+
+def test_qids_counts_each_symptom_domain_once():
+    qids = load_inventory("inventories/QIDS-SR-16.json")
+    scorer = CompiledScoring(qids)
+    values = np.zeros((1, 16))
+    values[0, [0, 1, 2, 3]] = [1, 3, 2, 0]   # sleep domain: worst item counts
+    values[0, [6, 7, 15]] = [2, 1, 0]        # psychomotor domain
+    values[0, [12, 13, 14]] = [0, 1, 3]      # appetite / weight domain
+    values[0, 4] = 2                         # sad mood, a domain of its own
+    assert scorer.score(values)["total"][0] == 3 + 2 + 3 + 2
+    assert scorer.score(np.full((1, 16), 3))["total"][0] == 27  # the top of the 0-27 range
+    assert scorer.score(values)["band"][0] == "Mild Depression"  # 6-10
+
+
+def mdq_answers(symptoms, together, problem):
+    """Option indices: `symptoms` of items 1-13 answered yes, item 14 yes/no, item 15 severity 0-3."""
+    return [1] * symptoms + [0] * (13 - symptoms) + [int(together), problem, 0, 0]
+
+
+@pytest.mark.parametrize("symptoms, together, problem, positive", [
+    (7, True, 2, True),     # 7 symptoms, at the same time, a moderate problem
+    (13, True, 3, True),
+    (6, True, 3, False),    # too few symptoms
+    (13, False, 3, False),  # not in the same period
+    (13, True, 1, False),   # only a minor problem
+])
+def test_mdq_screen(symptoms, together, problem, positive):
+    result = administer_inventory(load_inventory("inventories/MDQ.json"), mdq_answers(symptoms, together, problem))
+    assert result["positive_screen"] is positive
+    assert result["subscales"]["symptoms"] == symptoms
+    assert result["total_score"] == symptoms + together + problem
+
+
+def test_rescore_store_rows():
+    scores = pd.DataFrame({
+        "inventory": ["PHQ-4", "PHQ-4", "MDQ", "Unknown", "PHQ-4"],
+        "question_scores": [[1, 1, 0, 0], [3, 3, 3, 3], mdq_answers(8, True, 2), [1], [1, 2]],
+    })
+    rescored = rescore(scores, load_all())
+    assert rescored["rescored_total"].tolist()[:3] == [2, 12, 11]
+    assert rescored["band"].tolist()[:2] == ["None", "Severe"]
+    assert bool(rescored["positive"][2])
+    assert np.isnan(rescored["rescored_total"][3]) and np.isnan(rescored["rescored_total"][4])
+    assert rescored["band"][3] is None
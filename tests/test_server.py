@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+
+import interface.server as server
+
+
+@pytest.fixture
+def intake(monkeypatch, tiny_retriever):
+    """An in-process IntakeServer whose LLM picks the first offered inventory and writes no files."""
+    def query_llm(prompt, model, format=None, **kwargs):
+        if format is not None:
+            return json.dumps({"inventories": format["properties"]["inventories"]["items"]["enum"][:1]})
+        return "Impression: generalized anxiety is likely."
+
+    monkeypatch.setattr(server, "query_llm", query_llm)
+    return server.IntakeServer(retriever=tiny_retriever, llm_workers=1, save_csv=False)
+
+
+def finish(intake, session_id, reply):
+    """Answer option 0 to every question and wait for the impression."""
+    while reply["status"] == "in_progress":
+        reply = intake.answer(session_id, 0)
+    deadline = time.time() + 10
+    while intake.get(session_id)["status"] == "summarizing" and time.time() < deadline:
+        time.sleep(0.01)
+    return intake.get(session_id)
+
+
+def start(intake):
+    return intake.start_session({"first_name": "Jane", "last_name": "Doe", "dob": "01/01/1990",
+                                 "self_report": "I worry all the time and cannot sleep"})
+
+
+def test_session_completes_with_impression(intake):
+    reply = start(intake)
+    outcome = finish(intake, reply["session_id"], reply)
+    assert outcome["status"] == "complete"
+    assert outcome["diagnostic_impression"] == "Impression: generalized anxiety is likely."
+    assert [r["name"] for r in outcome["results"]][0] == "PHQ-4"
+
+
+def test_summary_retrieval_failure_still_completes(intake, monkeypatch):
+    reply = start(intake)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("index unavailable")
+
+    # Selection has already retrieved by the time the last answer arrives
+    while reply["status"] == "in_progress" and intake.get(reply["session_id"])["chosen_inventories"] == []:
+        reply = intake.answer(reply["session_id"], 0)
+    monkeypatch.setattr(intake.retriever, "retrieve_context", fail)
+    outcome = finish(intake, reply["session_id"], reply)
+    assert outcome["status"] == "complete"
+    assert outcome["diagnostic_impression"] == "Error during model execution: index unavailable"
+
+
+def test_self_report_is_encoded_once(intake, monkeypatch):
+    encoded = []
+    encode_queries = intake.retriever.encode_queries
+    monkeypatch.setattr(intake.retriever, "encode_queries",
+                        lambda queries: encoded.extend(queries) or encode_queries(queries))
+    reply = start(intake)
+    finish(intake, reply["session_id"], reply)
+    assert encoded.count("I worry all the time and cannot sleep") == 1
@@ -0,0 +1,195 @@
+"""
+Per-session tracing: nested timed spans plus counters, written as one JSONL file
+per session, and a summarizer that turns many trace files into latency percentiles.
+
+Instrumented code calls the module-level span()/count() helpers; they record into
+the tracer active in the current context and do nothing when there is none, so
+retrieval and the LLM client stay usable without a session around them.
+asyncio tasks and asyncio.to_thread copy the context, so spans opened in worker
+threads nest under the span that started them.
+
+Usage (from the project root):
+    python -m tracing output/*.trace.jsonl
+"""
+import json
+import time
+import argparse
+import itertools
+import threading
+import contextlib
+import contextvars
+from collections import defaultdict
+
+CHARS_PER_TOKEN = 4       # rough English average, good enough for budgeting and counters
+PERCENTILES = (50, 95, 99)
+
+_tracer = contextvars.ContextVar("tracer", default=None)
+_parent = contextvars.ContextVar("span_parent", default=None)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class Tracer:
+    def __init__(self, **info):
+        self.info = info                    # session-level fields written in the header line
+        self.spans = []
+        self.counters = defaultdict(float)
+        self._start = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Make this the tracer that span()/count() record into, for this context."""
+        token = _tracer.set(self)
+        try:
+            yield self
+        finally:
+            _tracer.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Time a block; the yielded dict takes extra attributes while the block runs."""
+        record = {"name": name, "id": next(self._ids), "parent": _parent.get(), "attrs": attrs}
+        token = _parent.set(record["id"])
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            _parent.reset(token)
+            record["start_s"] = start - self._start
+            record["duration_s"] = end - start
+            with self._lock:
+                self.spans.append(record)
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stage_totals(self, parent=None):
+        """Total seconds per span name among the children of `parent` (top level by default)."""
+        totals = {}
+        for s in self.spans:
+            if s["parent"] == parent:
+                totals[s["name"]] = totals.get(s["name"], 0.0) + s["duration_s"]
+        return totals
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"type": "session", **self.info}, ensure_ascii=False, default=str) + "\n")
+            for s in sorted(self.spans, key=lambda s: s["start_s"]):
+                f.write(json.dumps({"type": "span", **s}, ensure_ascii=False, default=str) + "\n")
+            f.write(json.dumps({"type": "counters", **self.counters}) + "\n")
+
+
+def current_tracer():
+    return _tracer.get()
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    tracer = _tracer.get()
+    if tracer is None:
+        yield attrs
+        return
+    with tracer.span(name, **attrs) as live:
+        yield live
+
+
+def count(name, value=1):
+    tracer = _tracer.get()
+    if tracer is not None:
+        tracer.count(name, value)
+
+
+# ==== SUMMARIZER ====
+def load_trace(path):
+    """(session header, spans, counters) from one trace file."""
+    header = {}
+    spans = []
+    counters = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["type"] == "session":
+                header = record
+            elif record["type"] == "span":
+                spans.append(record)
+            elif record["type"] == "counters":
+                counters = {k: v for k, v in record.items() if k != "type"}
+    return header, spans, counters
+
+
+def _stats(values):
+    import numpy as np  # only the summarizer needs it; sessions import tracing at startup
+
+    values = np.asarray(values, dtype=np.float64)
+    out = {"n": int(len(values)), "mean": float(values.mean())}
+    out.update({f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES})
+    return out
+
+
+def summarize(paths):
+    """
+    Percentiles across sessions: whole-session and per-span-name durations, numeric
+    span attributes as "<span>.<attr>" (e.g. llm.ttft_s) and per-session counters.
+    """
+    durations = defaultdict(list)
+    attrs = defaultdict(list)
+    counters = defaultdict(list)
+    for path in paths:
+        header, spans, session_counters = load_trace(path)
+        if "duration_s" in header:
+            durations["session"].append(header["duration_s"])
+        for s in spans:
+            durations[s["name"]].append(s["duration_s"])
+            for key, value in s["attrs"].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    attrs[f"{s['name']}.{key}"].append(value)
+        for key, value in session_counters.items():
+            counters[key].append(value)
+    return {
+        "sessions": len(paths),
+        "spans_s": {name: _stats(v) for name, v in sorted(durations.items())},
+        "span_attrs": {name: _stats(v) for name, v in sorted(attrs.items())},
+        "counters": {name: _stats(v) for name, v in sorted(counters.items())},
+    }
+
+
+def print_summary(summary):
+    print(f"{summary['sessions']} sessions")
+    for section in ("spans_s", "span_attrs", "counters"):
+        if not summary[section]:
+            continue
+        print(f"\n{section:<40}{'n':>6}" + "".join(f"{'p' + str(p):>12}" for p in PERCENTILES))
+        for name, s in summary[section].items():
+            print(f"{name:<40}{s['n']:>6}" + "".join(f"{s['p' + str(p)]:>12.3f}" for p in PERCENTILES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency percentiles across session trace files.")
+    parser.add_argument("traces", nargs="+", help="*.trace.jsonl files written by run_session")
+    parser.add_argument("--json", default=None, help="also write the summary to this JSON file")
+    args = parser.parse_args()
+
+    summary = summarize(args.traces)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\n✅ Summary saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
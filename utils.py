@@ -1,3 +1,5 @@
+import os
+import csv
 import json
 import datetime
 from pathlib import Path
@@ -8,12 +10,39 @@ def load_inventory(filepath):
     with open(filepath, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def administer_inventory(inventory):
-    """Run an inventory via CLI and record scores."""
+def _scored_result(inventory, answers):
+    """Result dict for one set of option indices, scored with the inventory's compiled rules."""
+    from scoring import compile_scoring  # numpy; kept off the startup path
+
+    scorer = compile_scoring(inventory)
+    values = scorer.values_from_answers(answers)
+    scores = scorer.score(values)
+    result = {
+        "name": inventory["title"],
+        "total_score": int(scores["total"][0]),
+        "question_scores": [int(v) for v in values[0]],
+    }
+    if scores["band"][0] is not None:
+        result["interpretation"] = scores["band"][0]
+    if scorer.cutoff is not None:
+        result["positive_screen"] = bool(scores["positive"][0])
+    if scorer.subscale_names:
+        result["subscales"] = {name: int(scores[name][0]) for name in scorer.subscale_names}
+    return result
+
+def administer_inventory(inventory, answers=None):
+    """
+    Run an inventory via CLI and record scores.
+    If `answers` (one option index per question) is given, replay them without prompting.
+    Totals, interpretation bands and subscales follow the inventory's scoring block (see scoring.py).
+    """
+    if answers is not None:
+        return _scored_result(inventory, answers)
+
     print(f"\n{inventory['title']}")
     print(inventory.get("instructions", ""))
 
-    question_scores = []
+    choices = []
     for q in inventory["questions"]:
         print(f"\n{q['id']}. {q['text']}")
         for i, choice in enumerate(q["options"]):  # ✅ FIXED: 'options' instead of 'choices'
@@ -22,21 +51,16 @@ def administer_inventory(inventory):
             try:
                 score = int(input("Your answer (number): "))
                 if 0 <= score < len(q["options"]):
-                    question_scores.append(q["options"][score]["value"])  # ✅ Use mapped value
+                    choices.append(score)  # ✅ mapped to option values when scored
                     break
                 else:
                     print("Invalid input. Try again.")
             except ValueError:
                 print("Invalid input. Enter a number.")
 
-    total_score = sum(question_scores)
-    return {
-        "name": inventory["title"],
-        "total_score": total_score,
-        "question_scores": question_scores
-    }
+    return _scored_result(inventory, choices)
 
-def generate_output_filename(first_name, last_name, date_str):
+def generate_output_filename(first_name, last_name, date_str, model_name=MODEL_NAME):
     """
     Convert patient name and today's date to formatted output filename like:
     John Smith + 07/04/2025 => JS_2025_07_04.csv
@@ -48,7 +72,29 @@ def generate_output_filename(first_name, last_name, date_str):
     except Exception:
         date_fmt = "UNKNOWN_DATE"
 
-    return f"output/{initials}_{date_fmt}" +"_" + MODEL_NAME + ".csv"
+    return f"output/{initials}_{date_fmt}" +"_" + model_name + ".csv"
+
+def generate_csv_output(patient_info, self_report, assessment_summary, results, filename="output/results.csv",
+                        quiet=False):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w", newline='', encoding="utf-8") as f:
+        writer = csv.writer(f)
+        metadata_row = [
+            f"{patient_info[0]} {patient_info[1]}",
+            patient_info[2],
+            self_report,
+            assessment_summary
+        ]
+        writer.writerow(metadata_row)
+        max_qs = max(len(r["question_scores"]) for r in results)
+        header_row = ["assessment name", "total score"] + [f"q{i+1} score" for i in range(max_qs)]
+        writer.writerow(header_row)
+        for r in results:
+            row = [r["name"], r["total_score"]] + r["question_scores"]
+            row += [""] * (len(header_row) - len(row))
+            writer.writerow(row)
+    if not quiet:
+        print(f"\n✅ Results saved to {filename}")
 
 # Ensure output directory exists
 Path("output").mkdir(parents=True, exist_ok=True)